@@ -1,47 +1,187 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, Response
 from config import Config
 
 from sqlalchemy import or_ 
+from sqlalchemy.exc import IntegrityError
 from models import db, User, Article, Comment, Like, NetworkStats
 from utils.decorators import login_required, vip_required
 from utils.network_monitor import NetworkMonitor
+from utils.metrics import QueryStats, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from utils.loaders import (for_list, load_list_context, load_comment_tree,
+                           search_index, search_ready, index_article, raw_connection,
+                           SearchPagination, keyset_paginate, render_article)
+from utils.pagination import ApproximateCounter
+from utils.search_engine import SearchIndex, snippet_fragments
+from utils.migrations import run_migrations
+from utils.counters import (adjust_counter, get_like_count, repair_counters, flush_view_counts,
+                            track_category_stats)
+from utils.category_stats import CategoryStats
+from utils.leaderboard import Leaderboard, LeaderboardEntry
+from utils.related import RelatedArticles, RelatedRefresher
+from utils.page_cache import PageCache, page_cache_key, article_tag, detail_tag, LIST_TAG
+from utils.content_versions import LIST_SCOPE, article_scope, bump_versions, load_versions
+from utils.conditional import compute_etag, last_modified_of, not_modified, with_validators
+from utils.content_renderer import RENDERER_VERSION, rerender_stale
+from utils.view_counter import ViewCounter
+from utils.templating import enable_bytecode_cache, warm_up_templates
+from utils.assets import AssetPipeline
+from utils.avatars import AvatarPipeline, AvatarRegistry
+from utils.compression import CompressionMiddleware
+from utils.current_user import UserCache, UserSnapshot
 from datetime import datetime
-import os
-import random
+import time
 app = Flask(__name__)
 app.config.from_object(Config)
+enable_bytecode_cache(app, app.config['TEMPLATE_CACHE_DIR'])
+assets = AssetPipeline(app, app.config['ASSET_BUILD_DIR'], app.config['ASSET_SOURCES'])
+avatar_pipeline = AvatarPipeline(app.static_folder, app.config['AVATAR_SIZES'], app.config['AVATAR_WORKERS'])
+avatar_pipeline.init_app(app)
+default_avatars = AvatarRegistry(app.static_folder, app.config['DEFAULT_AVATAR_FOLDER'],
+                                 app.config['DEFAULT_AVATAR_REFRESH'], on_change=avatar_pipeline.submit_all)
+# ORM 和 raw_connection 上的原生 SQL 都经过计时连接，计入 /metrics 的数据库指标
+query_stats = QueryStats()
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    # factory 是 sqlite3 专有参数，其他数据库驱动不认识；换数据库后 /metrics 没有查询指标
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).setdefault('connect_args', {})['factory'] = \
+        query_stats.connection_factory()
 db.init_app(app)
+compression = CompressionMiddleware(app.wsgi_app, app.config['COMPRESS_MIN_SIZE'], app.config['COMPRESS_LEVEL'],
+                                    app.config['COMPRESS_BROTLI_QUALITY'], app.config['COMPRESS_STREAMS'],
+                                    skip_prefixes=(app.static_url_path + '/',))
+app.wsgi_app = compression
 
-monitor = NetworkMonitor(app)
+monitor = NetworkMonitor(app, query_stats)
+app.wsgi_app = monitor.wrap_wsgi(app.wsgi_app)
+
+page_cache = PageCache(app.config['PAGE_CACHE_SIZE'], app.config['PAGE_CACHE_TTL'])
+
+def _load_user(user_id):
+    return UserSnapshot.of(db.session.get(User, user_id))
+
+user_cache = UserCache(_load_user, app.config['USER_CACHE_TTL'], app.config['USER_CACHE_SIZE'])
+current_user = user_cache.current
+
+def update_current_user(*criteria, **values):
+    """用一条 UPDATE 修改当前用户（不先查询），提交后使用户缓存失效；返回是否有行被更新"""
+    user_id = session['user_id']
+    updated = User.query.filter(User.id == user_id, *criteria).update(values, synchronize_session=False)
+    db.session.commit()
+    user_cache.invalidate(user_id)
+    return bool(updated)
+
+def _flush_view_counts(batch, commit):
+    with app.app_context():
+        flush_view_counts(batch, commit)
+    # 详情页缓存里记着落库前的阅读数，落库后需要重新渲染
+    page_cache.invalidate(*(detail_tag(article_id) for article_id in batch))
+
+view_counter = ViewCounter(_flush_view_counts, app.config['VIEW_COUNT_FLUSH_INTERVAL'])
+app.add_template_filter(view_counter.total, 'views')
+
+list_counter = ApproximateCounter(app.config['PAGINATION_COUNT_TTL'])
+
+category_stats = CategoryStats(app.config['CATEGORY_STATS_TTL'])
+track_category_stats(category_stats)
+
+def get_category_counts():
+    return category_stats.get_counts(lambda: CategoryStats.load(raw_connection()))
+
+leaderboard = Leaderboard(app.config['LEADERBOARD_SIZE'])
+
+def get_popular_articles(category=None):
+    """热门文章榜，进程内首次使用时从数据库构建"""
+    if not leaderboard.loaded:
+        leaderboard.rebuild(raw_connection(), 'article')
+    return leaderboard.top(category)
+
+related_articles = RelatedArticles('article', search_index)
+
+def _refresh_related(article_id):
+    with app.app_context():
+        related_ids = related_articles.refresh(raw_connection(), article_id)
+        bump_versions(raw_connection(), article_scope(article_id),
+                      *(article_scope(related_id) for related_id in related_ids))
+        db.session.commit()
+    page_cache.invalidate(detail_tag(article_id), *(detail_tag(related_id) for related_id in related_ids))
+    return related_ids
+
+related_refresher = RelatedRefresher(_refresh_related)
+
+monitor.metrics.register_cache('page', page_cache.stats)
+monitor.metrics.register_cache('user', user_cache.stats)
+monitor.metrics.register_task('view_counts', view_counter.status)
+monitor.metrics.register_task('related_articles', related_refresher.status)
+monitor.metrics.register_task('avatar_variants', avatar_pipeline.status)
+
+def list_validators(*parts):
+    """列表页的 (ETag, Last-Modified)：文章列表版本加上页面其余部分的依赖"""
+    version, updated_at = load_versions(raw_connection(), LIST_SCOPE)[LIST_SCOPE]
+    return compute_etag(LIST_SCOPE, version, *parts), last_modified_of(updated_at)
+
+def article_validators(article):
+    """文章页的 (ETag, Last-Modified)：文章自身的 updated_at 加上评论 / 点赞版本"""
+    scope = article_scope(article.id)
+    version, updated_at = load_versions(raw_connection(), scope)[scope]
+    etag = compute_etag(scope, version, article.updated_at, RENDERER_VERSION)
+    return etag, last_modified_of(article.updated_at, updated_at)
+
+MIGRATION_TABLES = {'article': 'article', 'comment': 'comment', 'like': 'like', 'network_stats': 'network_stats'}
 
 
 
 @app.before_request
 def before_request():
-    if request.endpoint and request.endpoint != 'static':
+    if request.endpoint != 'static':
+        # 没有匹配到路由的请求也计入监控
         monitor.record_request()
+        # 带哈希的 /assets 响应要能被共享缓存跨用户复用，读会话会让它带上 Vary: Cookie
+        if request.endpoint and request.endpoint != 'assets':
+            user_cache.sync_session()
+
+@app.after_request
+def after_request(response):
+    if request.endpoint != 'static':
+        monitor.record_response(request.endpoint, response.status_code)
+    return response
 
 @app.route('/')
 def index():
+    cache_key = page_cache_key()
+    cached = page_cache.get(cache_key)
+    if cached is not None:
+        return cached.response()
+    
+    popular_articles = get_popular_articles()
+    validators = list_validators(tuple(entry.id for entry in popular_articles))
+    response = not_modified(*validators)
+    if response is not None:
+        return response
+    
     page = request.args.get('page', 1, type=int)
     per_page = 10
     
-    articles = Article.query.filter_by(is_private=False).order_by(
-        Article.created_at.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
-    
-    popular_articles = Article.query.filter_by(is_private=False).order_by(
-        Article.view_count.desc()
-    ).limit(5).all()
+    base_query = Article.query.filter_by(is_private=False)
+    if 'page' in request.args:
+        # 兼容旧的页码链接
+        articles = for_list(base_query).order_by(
+            Article.created_at.desc()
+        ).paginate(page=page, per_page=per_page, error_out=False)
+    else:
+        articles = keyset_paginate(for_list(base_query), per_page,
+                                   after=request.args.get('after'),
+                                   before=request.args.get('before'))
+        articles.total = list_counter.get(('index',), base_query.count)
+    list_context = load_list_context(articles.items, session.get('user_id'))
     
-    categories = db.session.query(
-        Article.category, db.func.count(Article.id)
-    ).filter_by(is_private=False).group_by(Article.category).all()
+    categories = list(get_category_counts().items())
     
-    return render_template('index.html', 
+    html = render_template('index.html', 
                          articles=articles,
                          popular_articles=popular_articles,
-                         categories=categories)
+                         categories=categories,
+                         **list_context)
+    tags = [LIST_TAG] + [article_tag(article.id) for article in articles.items]
+    return with_validators(page_cache.set(cache_key, html, tags, validators=validators), *validators)
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -65,11 +205,9 @@ def register():
             
         user = User(username=username, email=email)
         user.set_password(password)
-        default_dir = "C:/Users/17906/Desktop/blog_system/static/images/默认图像"
-        files = os.listdir(default_dir)
-        images = [f for f in files if f.endswith(('.jpg', '.png', '.jpeg'))]
-        if images:
-            user.avatar = f"images/默认图像/{random.choice(images)}"
+        avatar = default_avatars.choice()
+        if avatar:
+            user.avatar = avatar
         db.session.add(user)
         db.session.commit()
         
@@ -110,6 +248,16 @@ def logout():
 
 @app.route('/article/<int:article_id>')
 def article_detail(article_id):
+    cache_key = page_cache_key()
+    cached = page_cache.get(cache_key)
+    if cached is not None:
+        # 命中缓存也要计入阅读数，meta 是渲染时文章的排行榜条目
+        view_counter.record(article_id)
+        if leaderboard.loaded:
+            entry = cached.meta
+            leaderboard.update(entry.id, entry.title, entry.category, view_counter.total(entry))
+        return cached.response()
+    
     article = Article.query.get_or_404(article_id)
     
     if article.is_private:
@@ -128,14 +276,26 @@ def article_detail(article_id):
                 flash('密码错误')
                 return render_template('article_password.html', article=article)
     
-    article.view_count += 1
-    db.session.commit()
+    view_counter.record(article.id)
+    if not article.is_private and leaderboard.loaded:
+        leaderboard.update(article.id, article.title, article.category, view_counter.total(article))
+    
+    if article.content_html_version != RENDERER_VERSION:
+        # 迁移前的旧文章或渲染规则升级后，首次访问时补渲染
+        render_article(article)
+        db.session.commit()
     
-    comments = Comment.query.filter_by(article_id=article_id, parent_id=None).order_by(
-        Comment.created_at.desc()
-    ).all()
+    validators = None
+    if not article.is_private:
+        # 阅读数不参与验证器，否则每次访问都会让 ETag 失效
+        validators = article_validators(article)
+        response = not_modified(*validators)
+        if response is not None:
+            return response
     
-    like_count = Like.query.filter_by(article_id=article_id).count()
+    comments = load_comment_tree(article_id)
+    
+    like_count = article.like_count
     user_liked = False
     if 'user_id' in session:
         user_liked = Like.query.filter_by(
@@ -143,11 +303,17 @@ def article_detail(article_id):
             article_id=article_id
         ).first() is not None
     
-    return render_template('article.html', 
+    html = render_template('article.html', 
                          article=article, 
                          comments=comments,
                          like_count=like_count,
-                         user_liked=user_liked)
+                         user_liked=user_liked,
+                         related_articles=related_articles.lookup(raw_connection(), article.id))
+    if article.is_private:
+        return html
+    meta = LeaderboardEntry(article.id, article.title, article.category, article.view_count or 0)
+    html = page_cache.set(cache_key, html, [article_tag(article.id), detail_tag(article.id)], meta, validators)
+    return with_validators(html, *validators)
 
 @app.route('/write', methods=['GET', 'POST'])
 @login_required
@@ -175,8 +341,13 @@ def write_article():
             password=password
         )
         
+        render_article(article)
         db.session.add(article)
+        index_article(article)
+        bump_versions(raw_connection(), LIST_SCOPE)
         db.session.commit()
+        page_cache.invalidate(LIST_TAG)
+        related_refresher.schedule(article.id)
         
         flash('文章发布成功')
         return redirect(url_for('article_detail', article_id=article.id))
@@ -190,48 +361,80 @@ def search():
     page = request.args.get('page', 1, type=int)
     per_page = 10
     
-    query = Article.query.filter_by(is_private=False)
+    popular_articles = get_popular_articles(category) if category else ()
+    validators = list_validators(tuple(entry.id for entry in popular_articles))
+    response = not_modified(*validators)
+    if response is not None:
+        return response
     
-    if keyword:
-        query = query.filter(
-            or_(
-                Article.title.contains(keyword),
-                Article.content.contains(keyword),
-                Article.tags.contains(keyword)
-            )
-        )
+    if keyword.strip() and search_ready():
+        # 全文索引按相关度排序
+        articles = SearchPagination(page=page, per_page=per_page, error_out=False,
+                                    keyword=keyword, category=category)
+    else:
+        query = Article.query.filter_by(is_private=False)
         
-    if category:
-        query = query.filter(Article.category == category)
+        if keyword:
+            query = query.filter(
+                or_(
+                    Article.title.contains(keyword),
+                    Article.content.contains(keyword),
+                    Article.tags.contains(keyword)
+                )
+            )
+            
+        if category:
+            query = query.filter(Article.category == category)
         
-    articles = query.order_by(Article.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+        if 'page' in request.args:
+            articles = for_list(query).order_by(Article.created_at.desc()).paginate(
+                page=page, per_page=per_page, error_out=False
+            )
+        else:
+            articles = keyset_paginate(for_list(query), per_page,
+                                       after=request.args.get('after'),
+                                       before=request.args.get('before'))
+            articles.total = list_counter.get(('search', keyword, category), query.count)
+    
+    snippets = {}
+    if keyword.strip():
+        snippets = snippet_fragments(raw_connection(), 'article',
+                                     [article.id for article in articles.items], keyword)
+    list_context = load_list_context(articles.items, session.get('user_id'))
 
     # 固定分类列表（与写文章的分类完全一致）
     fixed_categories = ["技术", "生活", "学习", "工作", "其他"]
     # 构建包含分类名称和对应文章数的列表
-    categories = []
-    for cate in fixed_categories:
-        count = Article.query.filter_by(category=cate, is_private=False).count()
-        categories.append((cate, count))
+    category_counts = get_category_counts()
+    categories = [(cate, category_counts.get(cate, 0)) for cate in fixed_categories]
     
-    return render_template('search.html', 
+    html = render_template('search.html', 
                          articles=articles, 
                          keyword=keyword,
                          category=category,
-                         categories=categories)  # 传递固定分类数据
+                         categories=categories,  # 传递固定分类数据
+                         snippets=snippets,
+                         popular_articles=popular_articles,
+                         **list_context)
+    return with_validators(html, *validators)
 
 
 @app.route('/profile/<username>')
 def profile(username):
     user = User.query.filter_by(username=username).first_or_404()
     
-    articles = Article.query.filter_by(user_id=user.id, is_private=False).order_by(
+    validators = list_validators(user.id, user.is_vip, user.avatar)
+    response = not_modified(*validators)
+    if response is not None:
+        return response
+    
+    articles = for_list(Article.query.filter_by(user_id=user.id, is_private=False)).order_by(
         Article.created_at.desc()
     ).limit(10).all()
+    list_context = load_list_context(articles, session.get('user_id'))
     
-    return render_template('profile.html', user=user, articles=articles)
+    html = render_template('profile.html', user=user, articles=articles, **list_context)
+    return with_validators(html, *validators)
 
 @app.route('/comment', methods=['POST'])
 @login_required
@@ -252,7 +455,10 @@ def add_comment():
     )
     
     db.session.add(comment)
+    adjust_counter(article_id, Article.comment_count, 1)
+    bump_versions(raw_connection(), LIST_SCOPE, article_scope(article_id))
     db.session.commit()
+    page_cache.invalidate(article_tag(article_id))
     
     flash('评论成功')
     return redirect(url_for('article_detail', article_id=article_id))
@@ -267,17 +473,26 @@ def like_article():
         article_id=article_id
     ).first()
     
-    if existing_like:
-        db.session.delete(existing_like)
-        action = 'unlike'
-    else:
-        like = Like(user_id=session['user_id'], article_id=article_id)
-        db.session.add(like)
+    try:
+        if existing_like:
+            db.session.delete(existing_like)
+            adjust_counter(article_id, Article.like_count, -1)
+            action = 'unlike'
+        else:
+            like = Like(user_id=session['user_id'], article_id=article_id)
+            db.session.add(like)
+            adjust_counter(article_id, Article.like_count, 1)
+            action = 'like'
+        
+        bump_versions(raw_connection(), LIST_SCOPE, article_scope(article_id))
+        db.session.commit()
+    except IntegrityError:
+        # 并发的重复点赞被唯一索引拦下，结果等同于已点赞
+        db.session.rollback()
         action = 'like'
+    page_cache.invalidate(article_tag(article_id))
     
-    db.session.commit()
-    
-    like_count = Like.query.filter_by(article_id=article_id).count()
+    like_count = get_like_count(article_id)
     
     return jsonify({
         'action': action,
@@ -293,35 +508,61 @@ def network_stats():
         'latency': monitor.get_current_latency(),
         'throughput': monitor.get_current_throughput(),
         'active_connections': monitor.get_active_connections(),
+        'latency_report': monitor.get_latency_report(),
         'timestamp': datetime.utcnow()
     }
     
+    # 最近一天的曲线按粒度从汇总表读取，而不是扫描原始采样
+    now = time.time()
+    history = monitor.history.query(raw_connection(), now - 86400, now)
+    
     return render_template('network_stats.html', 
                          stats=stats,
+                         history=history,
                          current_stats=current_stats)
 
+@app.route('/api/network/history')
+def api_network_history():
+    """按时间范围返回网络统计曲线：start / end 为 Unix 时间戳，或用 hours 表示最近几小时（默认 24）"""
+    now = time.time()
+    end = request.args.get('end', now, type=float)
+    start = request.args.get('start', type=float)
+    if start is None:
+        start = end - request.args.get('hours', 24, type=float) * 3600
+    return jsonify(monitor.history.query(raw_connection(), start, end, now))
+
 @app.route('/api/network/current')
 def api_network_current():
     return jsonify({
         'latency': monitor.get_current_latency(),
         'throughput': monitor.get_current_throughput(),
+        'throughput_windows': monitor.get_throughput_windows(),
+        'latency_percentiles': monitor.get_latency_report(),
         'active_connections': monitor.get_active_connections(),
+        'in_flight': monitor.get_in_flight(),
+        'page_cache': page_cache.stats(),
+        'compression': compression.stats(),
+        'user_cache': user_cache.stats(),
         'timestamp': datetime.utcnow().isoformat()
     })
 
+@app.route('/metrics')
+def metrics():
+    """OpenMetrics 文本格式的运行指标，供 Prometheus 抓取"""
+    return Response(monitor.render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/vip/purchase')
 @login_required
 def vip_purchase():
-    user = User.query.get(session['user_id'])
+    user = current_user()
     return render_template('vip_purchase.html', user=user)
 
 
 @app.route('/vip/upgrade', methods=['POST'])
 @login_required
 def vip_upgrade():
-    user = User.query.get(session['user_id'])
-    user.is_vip = True
-    db.session.commit()
+    user = current_user()
+    update_current_user(is_vip=True)
     
     session['is_vip'] = True
     flash('VIP升级成功！')
@@ -330,6 +571,7 @@ def vip_upgrade():
 def init_db():
     with app.app_context():
         db.create_all()
+        migrate_db()
         
         if not User.query.filter_by(username='admin').first():
             admin = User(username='admin', email='admin@example.com')
@@ -345,72 +587,157 @@ def init_db():
                 tags='博客,Flask,Python',
                 user_id=1
             )
+            render_article(article)
             db.session.add(article)
             db.session.commit()
+        
+        init_search_index()
+        leaderboard.rebuild(raw_connection(), 'article')
+        init_related_articles()
+
+def init_templates():
+    """按配置在接收请求前预编译全部模板，并报告耗时"""
+    if not app.config['TEMPLATE_WARMUP']:
+        return
+    count, elapsed = warm_up_templates(app)
+    print(f"已预编译 {count} 个模板，耗时 {elapsed:.1f} ms")
+
+def init_assets():
+    """压缩静态资源并生成带哈希的文件名，内容未变时复用已有产物"""
+    manifest = assets.build()
+    print(f"已构建 {len(manifest)} 个静态资源")
+
+def init_avatars():
+    """在后台为默认头像生成各尺寸缩略图（已生成的跳过），并开始监视默认头像目录"""
+    avatar_pipeline.submit_all(default_avatars)
+    default_avatars.start_background_task()
+
+def init_related_articles():
+    """把还没有相关文章结果的文章交给后台线程补算"""
+    if db.engine.dialect.name != 'sqlite':
+        return
+    for article_id in related_articles.missing_ids(raw_connection()):
+        related_refresher.schedule(article_id, cascade=False)
+
+def init_search_index():
+    """SQLite 支持 FTS5 时建立全文索引，否则搜索退回 LIKE 查询"""
+    conn = raw_connection()
+    if not SearchIndex.is_supported(conn):
+        search_index.enabled = False
+        print("当前数据库不支持 FTS5，搜索将使用普通查询")
+        return
+    
+    rebuilt = search_index.ensure_schema(conn)
+    db.session.commit()
+    if rebuilt:
+        print(f"已重建全文索引，共 {rebuilt} 篇文章")
+
+def migrate_db():
+    """create_all 不会修改已有表，列和索引的变更通过版本化迁移补齐"""
+    if db.engine.dialect.name != 'sqlite':
+        return
+    
+    raw = db.engine.raw_connection()
+    try:
+        applied = run_migrations(raw.driver_connection, MIGRATION_TABLES)
+    finally:
+        raw.close()
+    if applied:
+        print(f"数据库结构已升级到版本 {applied[-1]}")
+
+@app.cli.command('migrate-db')
+def migrate_db_command():
+    """执行尚未应用的数据库迁移"""
+    migrate_db()
+
+@app.cli.command('repair-counters')
+def repair_counters_command():
+    """重新计算所有文章的点赞数、评论数与分类统计"""
+    updated = repair_counters()
+    CategoryStats.rebuild(raw_connection(), 'article')
+    db.session.commit()
+    category_stats.invalidate()
+    print(f"已重新计算 {updated} 篇文章的计数")
+
+@app.cli.command('rerender-articles')
+def rerender_articles_command():
+    """重新渲染渲染版本过期的文章正文"""
+    count = rerender_stale(raw_connection(), 'article')
+    db.session.commit()
+    print(f"已重新渲染 {count} 篇文章")
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """压缩静态资源并写出带内容哈希的文件及预压缩副本"""
+    for source, built in assets.build().items():
+        print(f"{source} -> {built}")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """按文章表重建全文索引"""
+    conn = raw_connection()
+    if not SearchIndex.is_supported(conn):
+        print("当前数据库不支持 FTS5")
+        return
+    
+    search_index.ensure_schema(conn)
+    count = search_index.rebuild(conn)
+    db.session.commit()
+    print(f"已重建全文索引，共 {count} 篇文章")
 
 @app.route('/change_avatar', methods=['GET', 'POST'])
 @login_required
 def change_avatar():
-    default_dir = "C:/Users/17906/Desktop/blog_system/static/images/默认图像"
-    files = os.listdir(default_dir)
-
-    images = [f"images/默认图像/{f}" for f in files if f.endswith(('.jpg', '.png', '.jpeg'))]
-
     if request.method == 'POST':
-        avatar = request.form['avatar']
-        user = User.query.get(session['user_id'])
-        user.avatar = avatar
-        db.session.commit()
+        avatar = request.form.get('avatar')
+        if avatar not in default_avatars:
+            flash("请选择有效的头像")
+            return redirect(url_for('change_avatar'))
+        user = current_user()
+        update_current_user(avatar=avatar)
         flash("头像已更新")
         return redirect(url_for("profile", username=user.username))
 
-    return render_template("change_avatar.html", images=images)
+    return render_template("change_avatar.html", images=default_avatars.images)
 
 @app.route('/upload_avatar', methods=['POST'])
 @login_required
 def upload_avatar():
-    file = request.files['file']
+    file = request.files.get('file')
     if not file:
         flash("请选择文件")
         return redirect(url_for('change_avatar'))
 
-    filename = file.filename
-
-    save_path = os.path.join(
-        "C:/Users/17906/Desktop/blog_system/static/images/用户头像",
-        filename
-    )
-
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    file.save(save_path)
+    avatar = avatar_pipeline.save_upload(file, app.config['AVATAR_UPLOAD_FOLDER'], session['user_id'])
+    if avatar is None:
+        flash("请上传 jpg、png、gif 或 webp 格式的图片")
+        return redirect(url_for('change_avatar'))
 
-    user = User.query.get(session['user_id'])
-    user.avatar = f"images/用户头像/{filename}"
-    db.session.commit()
+    user = current_user()
+    update_current_user(avatar=avatar)
 
     flash("自定义头像上传成功")
     return redirect(url_for('profile', username=user.username))
 @app.route("/wallet")
 @login_required
 def wallet():
-    user = User.query.get(session['user_id'])
+    user = current_user()
     return render_template("wallet.html", user=user)
 @app.route("/wallet/recharge", methods=["POST"])
 @login_required
 def wallet_recharge():
-    user = User.query.get(session['user_id'])
+    user = current_user()
     money = int(request.form["money"])
 
     coins = money * 10   # 10 元 = 100 文币 → 1 : 10
 
-    # 首次充值赠送 15%
-    if user.wallet_balance == 0:
-        bonus = int(coins * 0.15)
+    # 首次充值赠送 15%；按余额为 0 条件更新，缓存的余额过期或并发充值时也只发一次奖励
+    bonus = int(coins * 0.15)
+    if user.wallet_balance == 0 and update_current_user(User.wallet_balance == 0, wallet_balance=coins + bonus):
         coins += bonus
         flash(f"首次充值奖励 +{bonus} 文币！")
-
-    user.wallet_balance += coins
-    db.session.commit()
+    else:
+        update_current_user(wallet_balance=User.wallet_balance + coins)
 
     # 检查是否是AJAX请求
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -434,7 +761,7 @@ def qrcode_payment():
     
     # 计算首充奖励
     bonus = 0
-    user = User.query.get(session['user_id'])
+    user = current_user()
     if user.wallet_balance == 0:
         bonus = total - coins
     
@@ -468,16 +795,14 @@ def api_payment_status():
 @app.route("/vip/pay_with_wallet", methods=["POST"])
 @login_required
 def vip_pay_with_wallet():
-    user = User.query.get(session['user_id'])
+    user = current_user()
 
-    if user.wallet_balance < 300:
+    # 余额检查放进 UPDATE 的条件里，不依赖缓存的余额
+    if not update_current_user(User.wallet_balance >= 300,
+                               wallet_balance=User.wallet_balance - 300, is_vip=True):
         flash("文币余额不足，请先充值")
         return redirect(url_for("vip_purchase"))
 
-    user.wallet_balance -= 300
-    user.is_vip = True
-    db.session.commit()
-
     session["is_vip"] = True
 
     flash("成功使用文币开通 VIP！")
@@ -485,5 +810,9 @@ def vip_pay_with_wallet():
 
 if __name__ == '__main__':
     init_db()
+    init_assets()
+    init_templates()
+    init_avatars()
     monitor.start_background_task()
+    view_counter.start_background_task()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -5,4 +5,49 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///blog.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = 'static/uploads'
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024
\ No newline at end of file
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+    # 阅读数缓冲落库的间隔（秒）
+    VIEW_COUNT_FLUSH_INTERVAL = float(os.environ.get('VIEW_COUNT_FLUSH_INTERVAL') or 5)
+    # 游标翻页时列表近似总数的缓存时间（秒）
+    PAGINATION_COUNT_TTL = int(os.environ.get('PAGINATION_COUNT_TTL') or 300)
+    # 分类统计在进程内缓存的时间（秒），本进程写入时会立即失效
+    CATEGORY_STATS_TTL = int(os.environ.get('CATEGORY_STATS_TTL') or 30)
+    # 热门文章榜（全站及每个分类）保留的篇数
+    LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE') or 5)
+    # 匿名访问整页缓存的最大条数（0 表示关闭）与过期时间（秒）
+    PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE') or 500)
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL') or 60)
+    # Jinja 字节码缓存目录（设为空字符串关闭）；启动时是否预编译全部模板
+    TEMPLATE_CACHE_DIR = os.environ.get(
+        'TEMPLATE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'jinja_cache'))
+    TEMPLATE_WARMUP = os.environ.get('TEMPLATE_WARMUP', '1') == '1'
+    # 需要压缩并加内容哈希的静态资源（相对 static 目录）；构建目录为空时使用 static/dist
+    ASSET_SOURCES = ['style.css', 'main.js']
+    ASSET_BUILD_DIR = os.environ.get('ASSET_BUILD_DIR') or None
+    # 头像目录（相对 static）、缩略图尺寸（像素）与生成缩略图的线程数
+    AVATAR_UPLOAD_FOLDER = 'images/用户头像'
+    DEFAULT_AVATAR_FOLDER = 'images/默认图像'
+    AVATAR_SIZES = (40, 96, 256)
+    AVATAR_WORKERS = int(os.environ.get('AVATAR_WORKERS') or 2)
+    # 默认头像清单检查目录变化的间隔（秒），0 表示只在启动时扫描一次
+    DEFAULT_AVATAR_REFRESH = int(os.environ.get('DEFAULT_AVATAR_REFRESH') or 300)
+    # 动态响应压缩：小于 COMPRESS_MIN_SIZE 字节的响应不压缩；gzip 级别 1-9，brotli 质量 0-11
+    # 流式响应默认不压缩，COMPRESS_STREAMS=1 时逐块压缩
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE') or 500)
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL') or 6)
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY') or 4)
+    COMPRESS_STREAMS = os.environ.get('COMPRESS_STREAMS', '0') == '1'
+    # 当前用户快照的跨请求缓存：有效期（秒）与最多缓存的用户数
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 30)
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 2000)
+    # 网络统计采样间隔（秒），以及原始采样和分钟/小时/天汇总的保留天数
+    # 日汇总直接从原始采样计算，原始采样至少保留 2 天
+    NETWORK_SAMPLE_INTERVAL = int(os.environ.get('NETWORK_SAMPLE_INTERVAL') or 10)
+    NETWORK_RETENTION_DAYS = {
+        'raw': int(os.environ.get('NETWORK_RAW_RETENTION_DAYS') or 2),
+        60: int(os.environ.get('NETWORK_MINUTE_RETENTION_DAYS') or 14),
+        3600: int(os.environ.get('NETWORK_HOUR_RETENTION_DAYS') or 180),
+        86400: int(os.environ.get('NETWORK_DAY_RETENTION_DAYS') or 730),
+    }
+    # 历史曲线一次最多返回的点数，据此自动选择粒度
+    NETWORK_HISTORY_MAX_POINTS = int(os.environ.get('NETWORK_HISTORY_MAX_POINTS') or 500)
\ No newline at end of file
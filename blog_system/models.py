@@ -25,6 +25,13 @@ class User(db.Model):
         return self.password_hash == hashlib.md5(password.encode('utf-8')).hexdigest()
 
 class Article(db.Model):
+    __table_args__ = (
+        db.Index('ix_article_private_created', 'is_private', 'created_at'),
+        db.Index('ix_article_private_views', 'is_private', 'view_count'),
+        db.Index('ix_article_category_private', 'category', 'is_private'),
+        db.Index('ix_article_user_created', 'user_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
@@ -38,11 +45,22 @@ class Article(db.Model):
     password = db.Column(db.String(100))
     require_vip = db.Column(db.Boolean, default=False)
     view_count = db.Column(db.Integer, default=0)
+    like_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    comment_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # 保存时渲染并过滤好的正文，content_html_version 落后于渲染器版本时需重新渲染
+    content_html = db.Column(db.Text)
+    content_html_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # 正文开头的一段，列表页只读它而不加载 content
+    excerpt = db.Column(db.Text)
     
     comments = db.relationship('Comment', backref='article', lazy='dynamic')
     likes = db.relationship('Like', backref='article', lazy='dynamic')
 
 class Comment(db.Model):
+    __table_args__ = (
+        db.Index('ix_comment_article_parent_created', 'article_id', 'parent_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -53,14 +71,24 @@ class Comment(db.Model):
     replies = db.relationship('Comment', backref=db.backref('parent', remote_side=[id]), lazy='dynamic')
 
 class Like(db.Model):
+    __table_args__ = (
+        db.Index('ix_like_article', 'article_id'),
+        db.Index('ux_like_user_article', 'user_id', 'article_id', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     article_id = db.Column(db.Integer, db.ForeignKey('article.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class NetworkStats(db.Model):
+    __table_args__ = (
+        db.Index('ix_network_stats_timestamp', 'timestamp'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     latency = db.Column(db.Float)
     throughput = db.Column(db.Float)
-    active_connections = db.Column(db.Integer)
\ No newline at end of file
+    active_connections = db.Column(db.Integer)
+    peak_connections = db.Column(db.Integer)  # 统计周期内的最高并发请求数
\ No newline at end of file
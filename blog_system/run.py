@@ -9,14 +9,24 @@ sys.path.insert(0, current_dir)
 def main():
     try:
         # 动态导入，避免循环导入问题
-        from app import app, init_db, monitor
+        from app import app, init_db, init_assets, init_templates, init_avatars, monitor, view_counter
         
         print("正在初始化数据库...")
         with app.app_context():
             init_db()
         
+        print("正在构建静态资源...")
+        init_assets()
+        
+        print("正在预编译模板...")
+        init_templates()
+        
+        print("正在生成头像缩略图...")
+        init_avatars()
+        
         print("启动网络监控...")
         monitor.start_background_task()
+        view_counter.start_background_task()
         
         print("博客系统启动成功!")
         print("访问地址: http://localhost:5000")
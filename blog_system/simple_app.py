@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, g, Response
 from datetime import datetime
 import os
 import random
@@ -10,88 +10,272 @@ import threading
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # 导入简化模型
+import simple_models
 from simple_models import init_db, User, Article, Comment, Like, NetworkStats
+from config import Config
+from utils.view_counter import ViewCounter
+from utils.leaderboard import Leaderboard, LeaderboardEntry
+from utils.related import RelatedArticles, RelatedRefresher
+from utils.page_cache import PageCache, page_cache_key, article_tag, detail_tag, LIST_TAG
+from utils.content_versions import LIST_SCOPE, article_scope, bump_versions, load_versions
+from utils.conditional import compute_etag, last_modified_of, not_modified, with_validators
+from utils.content_renderer import RENDERER_VERSION
+from utils.search_engine import snippet_fragments
+from utils.templating import enable_bytecode_cache, warm_up_templates
+from utils.assets import AssetPipeline
+from utils.avatars import AvatarPipeline, AvatarRegistry
+from utils.compression import CompressionMiddleware
+from utils.current_user import UserCache, UserSnapshot
+from utils.sliding_window import SlidingWindowCounter, window_label
+from utils.latency import LatencyTracker
+from utils.inflight import InFlightGauge
+from utils.timeseries import NetworkHistory
+from utils.metrics import MetricsRegistry, UNMATCHED_ENDPOINT, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
+enable_bytecode_cache(app, Config.TEMPLATE_CACHE_DIR)
+assets = AssetPipeline(app, Config.ASSET_BUILD_DIR, Config.ASSET_SOURCES)
+avatar_pipeline = AvatarPipeline(app.static_folder, Config.AVATAR_SIZES, Config.AVATAR_WORKERS)
+avatar_pipeline.init_app(app)
+default_avatars = AvatarRegistry(app.static_folder, Config.DEFAULT_AVATAR_FOLDER,
+                                 Config.DEFAULT_AVATAR_REFRESH, on_change=avatar_pipeline.submit_all)
+compression = CompressionMiddleware(app.wsgi_app, Config.COMPRESS_MIN_SIZE, Config.COMPRESS_LEVEL,
+                                    Config.COMPRESS_BROTLI_QUALITY, Config.COMPRESS_STREAMS,
+                                    skip_prefixes=(app.static_url_path + '/',))
+app.wsgi_app = compression
 
 # 模拟网络监控
 class SimpleNetworkMonitor:
     def __init__(self):
-        self.request_times = []
-        self.active_connections = 0
+        self.requests = SlidingWindowCounter()
+        self.latency = LatencyTracker()
+        # 正在处理的请求数，由 wrap_wsgi 包装的 WSGI 层在请求开始和结束时加减
+        self.in_flight = InFlightGauge()
+        self.sample_interval = Config.NETWORK_SAMPLE_INTERVAL
+        self.history = NetworkHistory('network_stats', self.sample_interval,
+                                      Config.NETWORK_RETENTION_DAYS, Config.NETWORK_HISTORY_MAX_POINTS)
+        # 数据库查询由 simple_models.get_db 创建的计时连接记录
+        self.metrics = MetricsRegistry(self.in_flight, simple_models.query_stats)
+        self.last_sample_at = None
+        self.metrics.register_task('network_stats', self._sample_status)
         self.lock = threading.Lock()
+    
+    def wrap_wsgi(self, wsgi_app):
+        return self.in_flight.wrap(wsgi_app)
         
     def record_request(self):
-        with self.lock:
-            current_time = time.time()
-            self.request_times.append(current_time)
-            self.active_connections += 1
-            
-            cutoff_time = current_time - 60
-            self.request_times = [t for t in self.request_times if t > cutoff_time]
+        self.requests.record()
+        g._monitor_started = time.perf_counter()
+        self.in_flight.assign(request.environ, request.endpoint or UNMATCHED_ENDPOINT)
+    
+    def record_response(self, endpoint, status):
+        """在 after_request 中调用，把本次请求的处理耗时计入端点的延迟直方图和 /metrics 的请求指标"""
+        endpoint = endpoint or UNMATCHED_ENDPOINT
+        started = g.pop('_monitor_started', None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            self.latency.record(endpoint, elapsed * 1000)
+            self.metrics.record_request(endpoint, request.method, status, elapsed)
+    
+    def _sample_status(self):
+        lag = time.time() - self.last_sample_at if self.last_sample_at else None
+        return lag, 0
+    
+    def render_metrics(self):
+        """OpenMetrics 文本格式的全部指标"""
+        return self.metrics.render()
     
     def get_current_latency(self):
-        if len(self.request_times) > 10:
-            return 50 + (len(self.request_times) % 20)
-        return 50
+        """最近一分钟所有请求延迟的中位数（毫秒），没有请求时为 0"""
+        return self.latency.histogram(window=60).percentile(0.5) or 0.0
+    
+    def get_latency_report(self):
+        """整体与各端点在 1、5、15 分钟窗口内的 p50 / p90 / p99 / max"""
+        return self.latency.report()
     
     def get_current_throughput(self):
-        cutoff_time = time.time() - 60
-        recent_requests = [t for t in self.request_times if t > cutoff_time]
-        return len(recent_requests)
+        return self.requests.count(60)
+    
+    def get_throughput_windows(self):
+        """最近 1、5、15 分钟的请求数"""
+        return {window_label(window): count for window, count in self.requests.counts().items()}
     
     def get_active_connections(self):
-        return self.active_connections
+        return self.in_flight.total
+    
+    def get_in_flight(self):
+        """当前并发数与本统计周期内的最高值，含按端点的明细"""
+        return self.in_flight.snapshot()
     
     def start_background_task(self):
         def stats_collector():
             while True:
-                time.sleep(60)
+                time.sleep(self.sample_interval)
                 NetworkStats.create(
                     self.get_current_latency(),
                     self.get_current_throughput(),
-                    self.get_active_connections()
+                    self.get_active_connections(),
+                    self.in_flight.reset_peaks()
                 )
+                conn = simple_models.get_db()
+                try:
+                    self.history.maintain(conn, conn.commit)
+                except Exception as e:
+                    print(f"汇总网络统计失败: {e}")
+                finally:
+                    conn.close()
+                self.last_sample_at = time.time()
         
         thread = threading.Thread(target=stats_collector)
         thread.daemon = True
         thread.start()
 
 monitor = SimpleNetworkMonitor()
+app.wsgi_app = monitor.wrap_wsgi(app.wsgi_app)
+
+page_cache = PageCache(Config.PAGE_CACHE_SIZE, Config.PAGE_CACHE_TTL)
+
+user_cache = UserCache(lambda user_id: UserSnapshot.of(User.get(user_id=user_id)),
+                       Config.USER_CACHE_TTL, Config.USER_CACHE_SIZE)
+current_user = user_cache.current
+
+def update_current_user(assignments, params=(), condition=''):
+    """用一条 UPDATE 修改当前用户（不先查询），提交后使用户缓存失效；返回是否有行被更新"""
+    user_id = session['user_id']
+    conn = simple_models.get_db()
+    cursor = conn.execute(f'UPDATE users SET {assignments} WHERE id = ? {condition}', (*params, user_id))
+    conn.commit()
+    conn.close()
+    user_cache.invalidate(user_id)
+    return cursor.rowcount > 0
+
+def _flush_view_counts(batch, commit):
+    Article.add_view_counts(batch, commit)
+    # 详情页缓存里记着落库前的阅读数，落库后需要重新渲染
+    page_cache.invalidate(*(detail_tag(article_id) for article_id in batch))
+
+view_counter = ViewCounter(_flush_view_counts, Config.VIEW_COUNT_FLUSH_INTERVAL)
+app.add_template_filter(view_counter.total, 'views')
+
+leaderboard = Leaderboard(Config.LEADERBOARD_SIZE)
+
+def rebuild_leaderboard():
+    conn = simple_models.get_db()
+    leaderboard.rebuild(conn, 'articles')
+    conn.close()
+
+def get_popular_articles(category=None):
+    """热门文章榜，进程内首次使用时从数据库构建"""
+    if not leaderboard.loaded:
+        rebuild_leaderboard()
+    return leaderboard.top(category)
+
+related_articles = RelatedArticles('articles', simple_models.search_index)
+
+def _refresh_related(article_id):
+    conn = simple_models.get_db()
+    related_ids = related_articles.refresh(conn, article_id)
+    bump_versions(conn, article_scope(article_id), *(article_scope(related_id) for related_id in related_ids))
+    conn.commit()
+    conn.close()
+    page_cache.invalidate(detail_tag(article_id), *(detail_tag(related_id) for related_id in related_ids))
+    return related_ids
+
+related_refresher = RelatedRefresher(_refresh_related)
+
+monitor.metrics.register_cache('page', page_cache.stats)
+monitor.metrics.register_cache('user', user_cache.stats)
+monitor.metrics.register_task('view_counts', view_counter.status)
+monitor.metrics.register_task('related_articles', related_refresher.status)
+monitor.metrics.register_task('avatar_variants', avatar_pipeline.status)
+
+def _load_version(scope):
+    conn = simple_models.get_db()
+    version = load_versions(conn, scope)[scope]
+    conn.close()
+    return version
+
+def list_validators(*parts):
+    """列表页的 (ETag, Last-Modified)：文章列表版本加上页面其余部分的依赖"""
+    version, updated_at = _load_version(LIST_SCOPE)
+    return compute_etag(LIST_SCOPE, version, *parts), last_modified_of(updated_at)
+
+def article_validators(article):
+    """文章页的 (ETag, Last-Modified)：文章自身的 updated_at 加上评论 / 点赞版本"""
+    scope = article_scope(article.id)
+    version, updated_at = _load_version(scope)
+    etag = compute_etag(scope, version, article.updated_at, RENDERER_VERSION)
+    return etag, last_modified_of(article.updated_at, updated_at)
+
+def get_related_articles(article_id):
+    conn = simple_models.get_db()
+    related = related_articles.lookup(conn, article_id)
+    conn.close()
+    return related
+
+def init_related_articles():
+    """把还没有相关文章结果的文章交给后台线程补算"""
+    conn = simple_models.get_db()
+    missing = related_articles.missing_ids(conn)
+    conn.close()
+    for article_id in missing:
+        related_refresher.schedule(article_id, cascade=False)
 
 @app.before_request
 def before_request():
-    if request.endpoint and request.endpoint != 'static':
+    if request.endpoint != 'static':
+        # 没有匹配到路由的请求也计入监控
         monitor.record_request()
+        # 带哈希的 /assets 响应要能被共享缓存跨用户复用，读会话会让它带上 Vary: Cookie
+        if request.endpoint and request.endpoint != 'assets':
+            user_cache.sync_session()
+
+@app.after_request
+def after_request(response):
+    if request.endpoint != 'static':
+        monitor.record_response(request.endpoint, response.status_code)
+    return response
 
 @app.route('/')
 def index():
+    cache_key = page_cache_key()
+    cached = page_cache.get(cache_key)
+    if cached is not None:
+        return cached.response()
+    
+    # 获取热门文章
+    popular_articles = get_popular_articles()
+    validators = list_validators(tuple(entry.id for entry in popular_articles))
+    response = not_modified(*validators)
+    if response is not None:
+        return response
+    
     page = request.args.get('page', 1, type=int)
     per_page = 10
     
-    # 获取文章列表
-    articles = Article.get(is_private=False, limit=per_page, offset=(page-1)*per_page)
+    # 获取文章列表，默认按游标翻页
+    if 'page' in request.args:
+        articles = Article.get(is_private=False, limit=per_page, offset=(page-1)*per_page, list_view=True)
+    else:
+        articles = Article.get_page(per_page, after=request.args.get('after'),
+                                    before=request.args.get('before'), is_private=False, list_view=True)
     
-    # 获取热门文章
-    popular_articles = Article.get(is_private=False, limit=5)
+    # 批量获取点赞数据
+    article_ids = [article.id for article in articles]
+    liked_ids = Like.liked_ids(session.get('user_id'), article_ids)
     
     # 获取分类统计
-    conn = simple_models.get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT category, COUNT(*) as count 
-        FROM articles 
-        WHERE is_private = 0 
-        GROUP BY category
-    ''')
-    categories = cursor.fetchall()
-    conn.close()
+    categories = list(Article.category_counts().items())
     
-    return render_template('index.html', 
+    html = render_template('index.html', 
                          articles=articles,
                          popular_articles=popular_articles,
-                         categories=categories)
+                         categories=categories,
+                         liked_ids=liked_ids)
+    html = page_cache.set(cache_key, html, [LIST_TAG] + [article_tag(article_id) for article_id in article_ids],
+                          validators=validators)
+    return with_validators(html, *validators)
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -105,7 +289,7 @@ def register():
             flash('密码不一致')
             return redirect(url_for('register'))
         
-        user = User.create(username, email, password)
+        user = User.create(username, email, password, default_avatars.choice())
         if not user:
             flash('用户名或邮箱已存在')
             return redirect(url_for('register'))
@@ -147,6 +331,16 @@ def logout():
 
 @app.route('/article/<int:article_id>')
 def article_detail(article_id):
+    cache_key = page_cache_key()
+    cached = page_cache.get(cache_key)
+    if cached is not None:
+        # 命中缓存也要计入阅读数，meta 是渲染时文章的排行榜条目
+        view_counter.record(article_id)
+        if leaderboard.loaded:
+            entry = cached.meta
+            leaderboard.update(entry.id, entry.title, entry.category, view_counter.total(entry))
+        return cached.response()
+    
     articles = Article.get(article_id=article_id)
     if not articles:
         flash('文章不存在')
@@ -170,10 +364,22 @@ def article_detail(article_id):
                 flash('密码错误')
                 return render_template('article_password.html', article=article)
     
-    article.increment_view_count()
+    view_counter.record(article.id)
+    if not article.is_private and leaderboard.loaded:
+        leaderboard.update(article.id, article.title, article.category, view_counter.total(article))
+    
+    article.ensure_rendered()
+    
+    validators = None
+    if not article.is_private:
+        # 阅读数不参与验证器，否则每次访问都会让 ETag 失效
+        validators = article_validators(article)
+        response = not_modified(*validators)
+        if response is not None:
+            return response
     
     # 获取评论
-    comments = Comment.get(article_id=article_id, parent_id=None)
+    comments = Comment.get(article_id=article_id, as_tree=True)
     
     # 获取点赞数和用户点赞状态
     like_count = Like.count(article_id)
@@ -185,12 +391,18 @@ def article_detail(article_id):
     # 获取作者信息
     author = User.get(user_id=article.user_id)
     
-    return render_template('article.html', 
+    html = render_template('article.html', 
                          article=article, 
                          comments=comments,
                          like_count=like_count,
                          user_liked=user_liked,
-                         author=author)
+                         author=author,
+                         related_articles=get_related_articles(article.id))
+    if article.is_private:
+        return html
+    meta = LeaderboardEntry(article.id, article.title, article.category, article.view_count or 0)
+    html = page_cache.set(cache_key, html, [article_tag(article.id), detail_tag(article.id)], meta, validators)
+    return with_validators(html, *validators)
 
 @app.route('/write', methods=['GET', 'POST'])
 def write_article():
@@ -220,6 +432,8 @@ def write_article():
             require_vip=require_vip,
             password=password
         )
+        page_cache.invalidate(LIST_TAG)
+        related_refresher.schedule(article.id)
         
         flash('文章发布成功')
         return redirect(url_for('article_detail', article_id=article.id))
@@ -233,45 +447,46 @@ def search():
     page = request.args.get('page', 1, type=int)
     per_page = 10
     
-    # 简化搜索实现
-    conn = simple_models.get_db()
-    cursor = conn.cursor()
-    
-    query = 'SELECT a.*, u.username as author_username FROM articles a JOIN users u ON a.user_id = u.id WHERE a.is_private = 0'
-    params = []
-    
-    if keyword:
-        query += ' AND (a.title LIKE ? OR a.content LIKE ? OR a.tags LIKE ?)'
-        keyword_pattern = f'%{keyword}%'
-        params.extend([keyword_pattern, keyword_pattern, keyword_pattern])
-        
-    if category:
-        query += ' AND a.category = ?'
-        params.append(category)
-        
-    query += ' ORDER BY a.created_at DESC LIMIT ? OFFSET ?'
-    params.extend([per_page, (page-1)*per_page])
+    validators = list_validators()
+    response = not_modified(*validators)
+    if response is not None:
+        return response
+    
+    # 优先走全文索引，按相关度排序
+    result = None
+    if keyword.strip():
+        result = Article.search(keyword, category=category, limit=per_page, offset=(page-1)*per_page)
+    
+    if result is not None:
+        articles, _ = result
+    elif 'page' in request.args:
+        articles = Article.get(is_private=False, keyword=keyword, category=category,
+                               limit=per_page, offset=(page-1)*per_page, list_view=True)
+    else:
+        # 按时间排序的结果用游标翻页，翻到后面也不必扫描并丢弃前面的行
+        articles = Article.get_page(per_page, after=request.args.get('after'),
+                                    before=request.args.get('before'), is_private=False,
+                                    keyword=keyword, category=category, list_view=True)
     
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    articles = [Article(**dict(row)) for row in rows]
+    snippets = {}
+    if keyword.strip():
+        conn = simple_models.get_db()
+        snippets = snippet_fragments(conn, 'articles', [article.id for article in articles], keyword)
+        conn.close()
     
     # 获取分类统计
-    cursor.execute('''
-        SELECT category, COUNT(*) as count 
-        FROM articles 
-        WHERE is_private = 0 
-        GROUP BY category
-    ''')
-    categories = cursor.fetchall()
+    categories = list(Article.category_counts().items())
     
-    conn.close()
+    article_ids = [article.id for article in articles]
     
-    return render_template('search.html', 
+    html = render_template('search.html', 
                          articles=articles, 
                          keyword=keyword,
                          category=category,
-                         categories=categories)
+                         categories=categories,
+                         snippets=snippets,
+                         liked_ids=Like.liked_ids(session.get('user_id'), article_ids))
+    return with_validators(html, *validators)
 
 @app.route('/profile/<username>')
 def profile(username):
@@ -280,9 +495,17 @@ def profile(username):
         flash('用户不存在')
         return redirect(url_for('index'))
     
-    articles = Article.get(user_id=user.id, is_private=False, limit=10)
+    validators = list_validators(user.id, user.is_vip, user.avatar)
+    response = not_modified(*validators)
+    if response is not None:
+        return response
     
-    return render_template('profile.html', user=user, articles=articles)
+    articles = Article.get(user_id=user.id, is_private=False, limit=10, list_view=True)
+    article_ids = [article.id for article in articles]
+    
+    html = render_template('profile.html', user=user, articles=articles,
+                         liked_ids=Like.liked_ids(session.get('user_id'), article_ids))
+    return with_validators(html, *validators)
 
 @app.route('/comment', methods=['POST'])
 def add_comment():
@@ -304,6 +527,7 @@ def add_comment():
         article_id=article_id,
         parent_id=parent_id if parent_id else None
     )
+    page_cache.invalidate(article_tag(article_id))
     
     flash('评论成功')
     return redirect(url_for('article_detail', article_id=article_id))
@@ -323,6 +547,7 @@ def like_article():
     else:
         Like.create(session['user_id'], article_id)
         action = 'like'
+    page_cache.invalidate(article_tag(article_id))
     
     like_count = Like.count(article_id)
     
@@ -343,29 +568,64 @@ def network_stats():
         'latency': monitor.get_current_latency(),
         'throughput': monitor.get_current_throughput(),
         'active_connections': monitor.get_active_connections(),
+        'latency_report': monitor.get_latency_report(),
         'timestamp': datetime.utcnow()
     }
     
+    # 最近一天的曲线按粒度从汇总表读取，而不是扫描原始采样
+    now = time.time()
+    conn = simple_models.get_db()
+    try:
+        history = monitor.history.query(conn, now - 86400, now)
+    finally:
+        conn.close()
+    
     return render_template('network_stats.html', 
                          stats=stats,
+                         history=history,
                          current_stats=current_stats)
 
+@app.route('/api/network/history')
+def api_network_history():
+    """按时间范围返回网络统计曲线：start / end 为 Unix 时间戳，或用 hours 表示最近几小时（默认 24）"""
+    now = time.time()
+    end = request.args.get('end', now, type=float)
+    start = request.args.get('start', type=float)
+    if start is None:
+        start = end - request.args.get('hours', 24, type=float) * 3600
+    conn = simple_models.get_db()
+    try:
+        return jsonify(monitor.history.query(conn, start, end, now))
+    finally:
+        conn.close()
+
 @app.route('/api/network/current')
 def api_network_current():
     return jsonify({
         'latency': monitor.get_current_latency(),
         'throughput': monitor.get_current_throughput(),
+        'throughput_windows': monitor.get_throughput_windows(),
+        'latency_percentiles': monitor.get_latency_report(),
         'active_connections': monitor.get_active_connections(),
+        'in_flight': monitor.get_in_flight(),
+        'page_cache': page_cache.stats(),
+        'compression': compression.stats(),
+        'user_cache': user_cache.stats(),
         'timestamp': datetime.utcnow().isoformat()
     })
 
+@app.route('/metrics')
+def metrics():
+    """OpenMetrics 文本格式的运行指标，供 Prometheus 抓取"""
+    return Response(monitor.render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/vip/purchase')
 def vip_purchase():
     if 'user_id' not in session:
         flash('请先登录')
         return redirect(url_for('login'))
         
-    user = User.get(user_id=session['user_id'])
+    user = current_user()
     return render_template('vip_purchase.html', user=user)
 
 @app.route('/vip/upgrade', methods=['POST'])
@@ -374,13 +634,9 @@ def vip_upgrade():
         flash('请先登录')
         return redirect(url_for('login'))
         
-    user = User.get(user_id=session['user_id'])
+    user = current_user()
     # 简化实现，直接更新VIP状态
-    conn = simple_models.get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET is_vip = 1 WHERE id = ?', (user.id,))
-    conn.commit()
-    conn.close()
+    update_current_user('is_vip = 1')
     
     session['is_vip'] = True
     flash('VIP升级成功！')
@@ -392,28 +648,18 @@ def change_avatar():
         flash('请先登录')
         return redirect(url_for('login'))
         
-    default_dir = "C:/Users/17906/Desktop/blog_system/static/images/默认图像"
-    if os.path.exists(default_dir):
-        files = os.listdir(default_dir)
-        images = [f"images/默认图像/{f}" for f in files if f.endswith(('.jpg', '.png', '.jpeg'))]
-    else:
-        images = []
-
     if request.method == 'POST':
-        avatar = request.form['avatar']
-        user = User.get(user_id=session['user_id'])
-        
-        # 更新头像
-        conn = simple_models.get_db()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET avatar = ? WHERE id = ?', (avatar, user.id))
-        conn.commit()
-        conn.close()
+        avatar = request.form.get('avatar')
+        if avatar not in default_avatars:
+            flash("请选择有效的头像")
+            return redirect(url_for('change_avatar'))
+        user = current_user()
+        update_current_user('avatar = ?', (avatar,))
         
         flash("头像已更新")
         return redirect(url_for("profile", username=user.username))
 
-    return render_template("change_avatar.html", images=images)
+    return render_template("change_avatar.html", images=default_avatars.images)
 
 @app.route('/upload_avatar', methods=['POST'])
 def upload_avatar():
@@ -421,28 +667,18 @@ def upload_avatar():
         flash('请先登录')
         return redirect(url_for('login'))
         
-    file = request.files['file']
+    file = request.files.get('file')
     if not file:
         flash("请选择文件")
         return redirect(url_for('change_avatar'))
 
-    filename = file.filename
-    save_path = os.path.join(
-        "C:/Users/17906/Desktop/blog_system/static/images/用户头像",
-        filename
-    )
-
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    file.save(save_path)
+    avatar = avatar_pipeline.save_upload(file, Config.AVATAR_UPLOAD_FOLDER, session['user_id'])
+    if avatar is None:
+        flash("请上传 jpg、png、gif 或 webp 格式的图片")
+        return redirect(url_for('change_avatar'))
 
-    user = User.get(user_id=session['user_id'])
-    
-    # 更新头像
-    conn = simple_models.get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET avatar = ? WHERE id = ?', (f"images/用户头像/{filename}", user.id))
-    conn.commit()
-    conn.close()
+    user = current_user()
+    update_current_user('avatar = ?', (avatar,))
 
     flash("自定义头像上传成功")
     return redirect(url_for('profile', username=user.username))
@@ -453,7 +689,7 @@ def wallet():
         flash('请先登录')
         return redirect(url_for('login'))
         
-    user = User.get(user_id=session['user_id'])
+    user = current_user()
     return render_template("wallet.html", user=user)
 
 @app.route("/wallet/recharge", methods=["POST"])
@@ -462,22 +698,19 @@ def wallet_recharge():
         flash('请先登录')
         return redirect(url_for('login'))
         
-    user = User.get(user_id=session['user_id'])
+    user = current_user()
     money = int(request.form["money"])
     coins = money * 10   # 10 元 = 100 文币 → 1 : 10
 
-    # 首次充值赠送 15%
-    if user.wallet_balance == 0:
-        bonus = int(coins * 0.15)
+    # 首次充值赠送 15%；按余额为 0 条件更新，缓存的余额过期或并发充值时也只发一次奖励
+    bonus = int(coins * 0.15)
+    if user.wallet_balance == 0 and update_current_user('wallet_balance = ?', (coins + bonus,),
+                                                        'AND wallet_balance = 0'):
         coins += bonus
         flash(f"首次充值奖励 +{bonus} 文币！")
-
-    # 更新余额
-    conn = simple_models.get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET wallet_balance = ? WHERE id = ?', (user.wallet_balance + coins, user.id))
-    conn.commit()
-    conn.close()
+    else:
+        # 更新余额
+        update_current_user('wallet_balance = wallet_balance + ?', (coins,))
 
     flash(f"充值成功！获得 {coins} 文币")
     return redirect(url_for("wallet"))
@@ -488,33 +721,56 @@ def vip_pay_with_wallet():
         flash('请先登录')
         return redirect(url_for('login'))
         
-    user = User.get(user_id=session['user_id'])
+    user = current_user()
 
-    if user.wallet_balance < 300:
+    # 更新余额和VIP状态；余额检查放进 UPDATE 的条件里，不依赖缓存的余额
+    if not update_current_user('wallet_balance = wallet_balance - 300, is_vip = 1',
+                               condition='AND wallet_balance >= 300'):
         flash("文币余额不足，请先充值")
         return redirect(url_for("vip_purchase"))
 
-    # 更新余额和VIP状态
-    conn = simple_models.get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET wallet_balance = ?, is_vip = ? WHERE id = ?', 
-                  (user.wallet_balance - 300, 1, user.id))
-    conn.commit()
-    conn.close()
-
     session["is_vip"] = True
 
     flash("成功使用文币开通 VIP！")
     return redirect(url_for("profile", username=user.username))
 
+@app.cli.command('repair-counters')
+def repair_counters_command():
+    """重新计算所有文章的点赞数、评论数与分类统计"""
+    updated = simple_models.repair_counters()
+    print(f"已重新计算 {updated} 篇文章的计数")
+
+def init_avatars():
+    """在后台为默认头像生成各尺寸缩略图（已生成的跳过），并开始监视默认头像目录"""
+    avatar_pipeline.submit_all(default_avatars)
+    default_avatars.start_background_task()
+
+@app.cli.command('rerender-articles')
+def rerender_articles_command():
+    """重新渲染渲染版本过期的文章正文"""
+    count = simple_models.rerender_articles()
+    print(f"已重新渲染 {count} 篇文章")
+
 def main():
     # 初始化数据库
     print("正在初始化数据库...")
     init_db()
+    rebuild_leaderboard()
+    init_related_articles()
+    
+    manifest = assets.build()
+    print(f"已构建 {len(manifest)} 个静态资源")
+    
+    if Config.TEMPLATE_WARMUP:
+        count, elapsed = warm_up_templates(app)
+        print(f"已预编译 {count} 个模板，耗时 {elapsed:.1f} ms")
+    
+    init_avatars()
     
     # 启动网络监控
     print("启动网络监控...")
     monitor.start_background_task()
+    view_counter.start_background_task()
     
     print("博客系统启动成功!")
     print("访问地址: http://localhost:5000")
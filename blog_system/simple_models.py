@@ -3,15 +3,41 @@ from datetime import datetime
 import hashlib
 import os
 
+from config import Config
+from utils.comment_tree import build_comment_tree
+from utils.search_engine import SearchIndex
+from utils.pagination import decode_cursor, build_keyset_page
+from utils.migrations import run_migrations, recount_sql
+from utils.category_stats import CategoryStats
+from utils.content_versions import LIST_SCOPE, article_scope, bump_versions
+from utils.content_renderer import render_content, make_excerpt, rerender_stale, RENDERER_VERSION
+from utils.metrics import QueryStats
+
+# 列表页只查询这些列，不读取正文
+LIST_COLUMNS = ('a.id, a.title, a.summary, a.excerpt, a.category, a.tags, a.created_at, a.updated_at, '
+                'a.user_id, a.is_private, a.require_vip, a.view_count, a.like_count, a.comment_count')
+
 # 数据库文件路径
 DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'instance', 'simple_blog.db')
 
+# 经 get_db 执行的查询都计入 /metrics 的数据库指标
+query_stats = QueryStats()
+TimedConnection = query_stats.connection_factory()
+
+MIGRATION_TABLES = {'article': 'articles', 'comment': 'comments', 'like': 'likes', 'network_stats': 'network_stats'}
+
+# 文章全文索引（FTS5）
+search_index = SearchIndex('articles', 'articles_fts')
+
+# 分类文章数统计的进程内缓存
+category_stats = CategoryStats(Config.CATEGORY_STATS_TTL)
+
 def get_db():
     """获取数据库连接"""
     if not os.path.exists(os.path.dirname(DATABASE_PATH)):
         os.makedirs(os.path.dirname(DATABASE_PATH))
     
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = sqlite3.connect(DATABASE_PATH, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -50,6 +76,11 @@ def init_db():
         password TEXT,
         require_vip BOOLEAN DEFAULT 0,
         view_count INTEGER DEFAULT 0,
+        like_count INTEGER NOT NULL DEFAULT 0,
+        comment_count INTEGER NOT NULL DEFAULT 0,
+        content_html TEXT,
+        content_html_version INTEGER NOT NULL DEFAULT 0,
+        excerpt TEXT,
         FOREIGN KEY (user_id) REFERENCES users (id)
     )
     ''')
@@ -88,10 +119,16 @@ def init_db():
         timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         latency REAL,
         throughput REAL,
-        active_connections INTEGER
+        active_connections INTEGER,
+        peak_connections INTEGER
     )
     ''')
     
+    # 版本化迁移：补齐旧库的列与索引
+    applied = run_migrations(conn, MIGRATION_TABLES)
+    if applied:
+        print(f"数据库结构已升级到版本 {applied[-1]}")
+    
     # 检查是否存在admin用户，不存在则创建
     cursor.execute('SELECT * FROM users WHERE username = ?', ('admin',))
     if not cursor.fetchone():
@@ -102,15 +139,44 @@ def init_db():
         ''', ('admin', 'admin@example.com', admin_password_hash, 1))
         
         # 创建示例文章
+        content = '这是一个基于Flask开发的博客系统，支持文章发布、评论、点赞等功能。'
         cursor.execute('''
-        INSERT INTO articles (title, content, summary, category, tags, user_id)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', ('欢迎使用博客系统', '这是一个基于Flask开发的博客系统，支持文章发布、评论、点赞等功能。', 
-               '博客系统介绍', '技术', '博客,Flask,Python', 1))
+        INSERT INTO articles (title, content, summary, category, tags, user_id, excerpt)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', ('欢迎使用博客系统', content, '博客系统介绍', '技术', '博客,Flask,Python', 1, make_excerpt(content)))
+        CategoryStats.apply_change(conn, new=('技术', False))
+    
+    if SearchIndex.is_supported(conn):
+        search_index.ensure_schema(conn)
+    else:
+        search_index.enabled = False
     
     conn.commit()
     conn.close()
 
+def repair_counters():
+    """按 likes / comments 表重新计算所有文章的计数，返回更新的文章数"""
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    cursor.execute(recount_sql(MIGRATION_TABLES))
+    updated = cursor.rowcount
+    CategoryStats.rebuild(conn, 'articles')
+    conn.commit()
+    category_stats.invalidate()
+    conn.close()
+    
+    return updated
+
+def rerender_articles():
+    """重新渲染渲染版本过期的文章正文，返回处理的篇数"""
+    conn = get_db()
+    count = rerender_stale(conn, 'articles')
+    conn.commit()
+    conn.close()
+    
+    return count
+
 class User:
     def __init__(self, **kwargs):
         self.id = kwargs.get('id')
@@ -143,7 +209,7 @@ class User:
         return None
     
     @staticmethod
-    def create(username, email, password):
+    def create(username, email, password, avatar=None):
         conn = get_db()
         cursor = conn.cursor()
         
@@ -151,9 +217,9 @@ class User:
         
         try:
             cursor.execute('''
-            INSERT INTO users (username, email, password_hash)
-            VALUES (?, ?, ?)
-            ''', (username, email, password_hash))
+            INSERT INTO users (username, email, password_hash, avatar)
+            VALUES (?, ?, ?, ?)
+            ''', (username, email, password_hash, avatar))
             
             user_id = cursor.lastrowid
             conn.commit()
@@ -202,13 +268,24 @@ class Article:
         self.password = kwargs.get('password')
         self.require_vip = bool(kwargs.get('require_vip', 0))
         self.view_count = kwargs.get('view_count', 0)
+        self.like_count = kwargs.get('like_count', 0)
+        self.comment_count = kwargs.get('comment_count', 0)
+        self.content_html = kwargs.get('content_html')
+        self.content_html_version = kwargs.get('content_html_version', 0)
+        self.excerpt = kwargs.get('excerpt')
+        self.author_username = kwargs.get('author_username')
     
     @staticmethod
-    def get(article_id=None, user_id=None, is_private=None, limit=None, offset=None):
+    def get(article_id=None, user_id=None, is_private=None, limit=None, offset=None,
+            after=None, before=None, list_view=False, keyword=None, category=None):
+        """after / before 为 (created_at, id)，按游标取其后 / 其前的文章；
+        list_view 为 True 时只查询列表页需要的列，不读取正文；
+        keyword 按标题、正文、标签做 LIKE 匹配（全文索引不可用时的搜索）"""
         conn = get_db()
         cursor = conn.cursor()
         
-        query = 'SELECT a.*, u.username as author_username FROM articles a JOIN users u ON a.user_id = u.id WHERE 1=1'
+        columns = LIST_COLUMNS if list_view else 'a.*'
+        query = f'SELECT {columns}, u.username as author_username FROM articles a JOIN users u ON a.user_id = u.id WHERE 1=1'
         params = []
         
         if article_id:
@@ -223,7 +300,23 @@ class Article:
             query += ' AND a.is_private = ?'
             params.append(int(is_private))
         
-        query += ' ORDER BY a.created_at DESC'
+        if keyword:
+            query += ' AND (a.title LIKE ? OR a.content LIKE ? OR a.tags LIKE ?)'
+            keyword_pattern = f'%{keyword}%'
+            params.extend([keyword_pattern, keyword_pattern, keyword_pattern])
+        
+        if category:
+            query += ' AND a.category = ?'
+            params.append(category)
+        
+        if before:
+            query += ' AND (a.created_at, a.id) > (?, ?) ORDER BY a.created_at ASC, a.id ASC'
+            params.extend(before)
+        else:
+            if after:
+                query += ' AND (a.created_at, a.id) < (?, ?)'
+                params.extend(after)
+            query += ' ORDER BY a.created_at DESC, a.id DESC'
         
         if limit:
             query += ' LIMIT ?'
@@ -239,31 +332,150 @@ class Article:
         
         return [Article(**dict(row)) for row in rows]
     
+    @staticmethod
+    def get_page(per_page, after=None, before=None, **filters):
+        """游标翻页，after / before 为翻页令牌，返回 KeysetPage"""
+        before = decode_cursor(before)
+        after = None if before else decode_cursor(after)
+        
+        rows = Article.get(limit=per_page + 1, after=after, before=before, **filters)
+        return build_keyset_page(rows, per_page, lambda article: (article.created_at, article.id),
+                                 before=before is not None, has_cursor=after is not None)
+    
     @staticmethod
     def create(title, content, user_id, **kwargs):
         conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
-        INSERT INTO articles (title, content, user_id, summary, category, tags, is_private, password, require_vip)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO articles (title, content, user_id, summary, category, tags, is_private, password, require_vip,
+                              content_html, content_html_version, excerpt)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (title, content, user_id, kwargs.get('summary'), kwargs.get('category'), 
                kwargs.get('tags'), int(kwargs.get('is_private', 0)), kwargs.get('password'), 
-               int(kwargs.get('require_vip', 0))))
+               int(kwargs.get('require_vip', 0)), render_content(content), RENDERER_VERSION,
+               make_excerpt(content)))
         
         article_id = cursor.lastrowid
+        if search_index.is_ready(conn):
+            search_index.index_article(conn, article_id, title, kwargs.get('summary'),
+                                       kwargs.get('tags'), content)
+        CategoryStats.apply_change(conn, new=(kwargs.get('category'), bool(kwargs.get('is_private', 0))))
+        bump_versions(conn, LIST_SCOPE)
         conn.commit()
         conn.close()
+        category_stats.invalidate()
         
         return Article.get(article_id=article_id)[0]
     
-    def increment_view_count(self):
+    @staticmethod
+    def update(article_id, **fields):
+        """更新文章字段，同步全文索引与分类统计"""
+        columns = [name for name in ('title', 'content', 'summary', 'category', 'tags',
+                                     'is_private', 'password', 'require_vip') if name in fields]
+        if not columns:
+            return
+        if 'content' in fields:
+            fields = dict(fields, content_html=render_content(fields['content']),
+                          content_html_version=RENDERER_VERSION, excerpt=make_excerpt(fields['content']))
+            columns += ['content_html', 'content_html_version', 'excerpt']
+        
         conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE articles SET view_count = view_count + 1 WHERE id = ?', (self.id,))
+        old = conn.execute('SELECT category, is_private FROM articles WHERE id = ?', (article_id,)).fetchone()
+        if not old:
+            conn.close()
+            return
+        
+        assignments = ', '.join(f'{name} = ?' for name in columns)
+        conn.execute(f'UPDATE articles SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                     [fields[name] for name in columns] + [article_id])
+        
+        row = conn.execute('SELECT * FROM articles WHERE id = ?', (article_id,)).fetchone()
+        if search_index.is_ready(conn):
+            search_index.index_article(conn, article_id, row['title'], row['summary'], row['tags'], row['content'])
+        CategoryStats.apply_change(conn, (old['category'], bool(old['is_private'])),
+                                   (row['category'], bool(row['is_private'])))
+        bump_versions(conn, LIST_SCOPE, article_scope(article_id))
+        conn.commit()
+        conn.close()
+        category_stats.invalidate()
+    
+    @staticmethod
+    def delete(article_id):
+        """删除文章，同步全文索引与分类统计"""
+        conn = get_db()
+        old = conn.execute('SELECT category, is_private FROM articles WHERE id = ?', (article_id,)).fetchone()
+        if not old:
+            conn.close()
+            return
+        
+        conn.execute('DELETE FROM articles WHERE id = ?', (article_id,))
+        if search_index.is_ready(conn):
+            search_index.remove_article(conn, article_id)
+        CategoryStats.apply_change(conn, old=(old['category'], bool(old['is_private'])))
+        bump_versions(conn, LIST_SCOPE, article_scope(article_id))
+        conn.commit()
+        conn.close()
+        category_stats.invalidate()
+    
+    @staticmethod
+    def category_counts():
+        """各分类公开文章数，读物化统计表并缓存在进程内"""
+        def load():
+            conn = get_db()
+            counts = CategoryStats.load(conn)
+            conn.close()
+            return counts
+        
+        return category_stats.get_counts(load)
+    
+    @staticmethod
+    def search(keyword, category=None, limit=10, offset=0):
+        """全文检索公开文章，按相关度返回 (文章列表, 命中总数)；索引不可用时返回 None"""
+        conn = get_db()
+        if not search_index.is_ready(conn):
+            conn.close()
+            return None
+        
+        ids, total = search_index.search(conn, keyword, category=category, limit=limit, offset=offset)
+        rows = []
+        if ids:
+            placeholders = ','.join('?' * len(ids))
+            rows = conn.execute(f'''
+            SELECT {LIST_COLUMNS}, u.username as author_username FROM articles a JOIN users u ON a.user_id = u.id
+            WHERE a.id IN ({placeholders})
+            ''', ids).fetchall()
+        conn.close()
+        
+        by_id = {row['id']: Article(**dict(row)) for row in rows}
+        return [by_id[article_id] for article_id in ids if article_id in by_id], total
+    
+    def ensure_rendered(self):
+        """渲染版本过期（如迁移前的旧文章）时重新渲染正文并写回"""
+        if self.content_html_version == RENDERER_VERSION:
+            return
+        self.content_html = render_content(self.content)
+        self.content_html_version = RENDERER_VERSION
+        conn = get_db()
+        conn.execute('UPDATE articles SET content_html = ?, content_html_version = ? WHERE id = ?',
+                     (self.content_html, RENDERER_VERSION, self.id))
         conn.commit()
         conn.close()
-        self.view_count += 1
+    
+    @staticmethod
+    def add_view_counts(batch, commit=None):
+        """把 {article_id: 增量} 在一个事务里批量加到 view_count 上；commit 见 ViewCounter"""
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.executemany('UPDATE articles SET view_count = COALESCE(view_count, 0) + ? WHERE id = ?',
+                          [(delta, article_id) for article_id, delta in batch.items()])
+        try:
+            if commit is None:
+                conn.commit()
+            else:
+                commit(conn.commit)
+        finally:
+            conn.close()
     
     def to_dict(self):
         return {
@@ -279,7 +491,9 @@ class Article:
             'is_private': self.is_private,
             'password': self.password,
             'require_vip': self.require_vip,
-            'view_count': self.view_count
+            'view_count': self.view_count,
+            'like_count': self.like_count,
+            'comment_count': self.comment_count
         }
 
 class Comment:
@@ -290,9 +504,14 @@ class Comment:
         self.user_id = kwargs.get('user_id')
         self.article_id = kwargs.get('article_id')
         self.parent_id = kwargs.get('parent_id')
+        self.author_username = kwargs.get('author_username')
     
     @staticmethod
-    def get(article_id=None, parent_id=None):
+    def get(article_id=None, parent_id=None, as_tree=False):
+        """as_tree=True 时一次查询取回文章全部评论，返回组装好的顶层评论列表"""
+        if as_tree:
+            return Comment.get_tree(article_id)
+        
         conn = get_db()
         cursor = conn.cursor()
         
@@ -306,9 +525,9 @@ class Comment:
         if parent_id is not None:
             if parent_id:
                 query += ' AND c.parent_id = ?'
+                params.append(parent_id)
             else:
                 query += ' AND c.parent_id IS NULL'
-            params.append(parent_id)
         
         query += ' ORDER BY c.created_at DESC'
         
@@ -318,6 +537,22 @@ class Comment:
         
         return [Comment(**dict(row)) for row in rows]
     
+    @staticmethod
+    def get_tree(article_id):
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+        SELECT c.*, u.username as author_username
+        FROM comments c JOIN users u ON c.user_id = u.id
+        WHERE c.article_id = ?
+        ORDER BY c.created_at ASC, c.id ASC
+        ''', (article_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return build_comment_tree([Comment(**dict(row)) for row in rows])
+    
     @staticmethod
     def create(content, user_id, article_id, parent_id=None):
         conn = get_db()
@@ -329,6 +564,8 @@ class Comment:
         ''', (content, user_id, article_id, parent_id))
         
         comment_id = cursor.lastrowid
+        cursor.execute('UPDATE articles SET comment_count = comment_count + 1 WHERE id = ?', (article_id,))
+        bump_versions(conn, LIST_SCOPE, article_scope(article_id))
         conn.commit()
         conn.close()
         
@@ -378,12 +615,20 @@ class Like:
         conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-        INSERT INTO likes (user_id, article_id)
-        VALUES (?, ?)
-        ''', (user_id, article_id))
+        try:
+            cursor.execute('''
+            INSERT INTO likes (user_id, article_id)
+            VALUES (?, ?)
+            ''', (user_id, article_id))
+        except sqlite3.IntegrityError:
+            # 并发的重复点赞被唯一索引拦下，结果等同于已点赞，不再增加计数
+            conn.rollback()
+            conn.close()
+            return Like.get(user_id=user_id, article_id=article_id)[0]
         
         like_id = cursor.lastrowid
+        cursor.execute('UPDATE articles SET like_count = like_count + 1 WHERE id = ?', (article_id,))
+        bump_versions(conn, LIST_SCOPE, article_scope(article_id))
         conn.commit()
         conn.close()
         
@@ -395,6 +640,10 @@ class Like:
         cursor = conn.cursor()
         
         cursor.execute('DELETE FROM likes WHERE user_id = ? AND article_id = ?', (user_id, article_id))
+        if cursor.rowcount:
+            cursor.execute('UPDATE articles SET like_count = like_count - ? WHERE id = ?',
+                          (cursor.rowcount, article_id))
+            bump_versions(conn, LIST_SCOPE, article_scope(article_id))
         conn.commit()
         conn.close()
     
@@ -403,11 +652,30 @@ class Like:
         conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT COUNT(*) as count FROM likes WHERE article_id = ?', (article_id,))
+        cursor.execute('SELECT like_count FROM articles WHERE id = ?', (article_id,))
         row = cursor.fetchone()
         conn.close()
         
-        return row['count'] if row else 0
+        return row['like_count'] if row else 0
+    
+    @staticmethod
+    def liked_ids(user_id, article_ids):
+        """一次查询取回用户点赞过的文章 id 集合"""
+        if not user_id or not article_ids:
+            return set()
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        placeholders = ','.join('?' * len(article_ids))
+        cursor.execute(f'''
+        SELECT article_id FROM likes
+        WHERE user_id = ? AND article_id IN ({placeholders})
+        ''', [user_id] + list(article_ids))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return {row['article_id'] for row in rows}
     
     def to_dict(self):
         return {
@@ -424,22 +692,24 @@ class NetworkStats:
         self.latency = kwargs.get('latency')
         self.throughput = kwargs.get('throughput')
         self.active_connections = kwargs.get('active_connections')
+        self.peak_connections = kwargs.get('peak_connections')
     
     @staticmethod
-    def create(latency, throughput, active_connections):
+    def create(latency, throughput, active_connections, peak_connections=None):
         conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
-        INSERT INTO network_stats (latency, throughput, active_connections)
-        VALUES (?, ?, ?)
-        ''', (latency, throughput, active_connections))
+        INSERT INTO network_stats (latency, throughput, active_connections, peak_connections)
+        VALUES (?, ?, ?, ?)
+        ''', (latency, throughput, active_connections, peak_connections))
         
         stats_id = cursor.lastrowid
         conn.commit()
         conn.close()
         
-        return NetworkStats.get(stats_id=stats_id)[0]
+        return NetworkStats(id=stats_id, latency=latency, throughput=throughput,
+                            active_connections=active_connections, peak_connections=peak_connections)
     
     @staticmethod
     def get(limit=None):
@@ -465,5 +735,6 @@ class NetworkStats:
             'timestamp': self.timestamp,
             'latency': self.latency,
             'throughput': self.throughput,
-            'active_connections': self.active_connections
+            'active_connections': self.active_connections,
+            'peak_connections': self.peak_connections
         }
\ No newline at end of file
@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from flask import request, send_from_directory, url_for, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    # requirements.txt 声明了 Brotli；环境里缺少时退回只生成 .gz
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+
+# 带内容哈希的文件名永不改变内容，可以长期缓存
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# 预压缩文件按优先级排列：(编码, 扩展名)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+MIMETYPES = {'.css': 'text/css', '.js': 'application/javascript'}
+
+
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    # 冒号前的空格在选择器里有意义（如 ".a :hover"），只去掉冒号后的
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    """保守的 JS 压缩：去掉缩进、空行和整行注释，保留换行以免影响自动分号插入
+
+    模板字符串跨行时其中的行原样保留。
+    """
+    lines = []
+    in_template = False
+    in_comment = False
+    for line in source.splitlines():
+        stripped = line.strip()
+        if in_template:
+            lines.append(line)
+        elif in_comment:
+            if '*/' in stripped:
+                in_comment = False
+                rest = stripped.split('*/', 1)[1].strip()
+                if rest:
+                    lines.append(rest)
+            continue
+        elif not stripped or stripped.startswith('//'):
+            continue
+        elif stripped.startswith('/*'):
+            if '*/' not in stripped:
+                in_comment = True
+                continue
+            # 注释在同一行结束时保留其后的代码
+            stripped = stripped.split('*/', 1)[1].strip()
+            if not stripped:
+                continue
+            lines.append(stripped)
+        else:
+            lines.append(stripped)
+        # 去掉转义的反引号后数一下，奇数个说明模板字符串跨到了下一行
+        if len(re.findall(r'(?<!\\)`', line)) % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build_assets(static_folder, sources, build_dir, gzip_level=9, brotli_quality=11):
+    """压缩并写出带内容哈希的文件及 .gz / .br 副本，返回 {源文件名: 构建后文件名}"""
+    os.makedirs(build_dir, exist_ok=True)
+    manifest = {}
+    for name in sources:
+        base, ext = os.path.splitext(name)
+        with open(os.path.join(static_folder, name), encoding='utf-8') as f:
+            source = f.read()
+        minify = MINIFIERS.get(ext)
+        data = (minify(source) if minify else source).encode('utf-8')
+
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        built = f'{base}.{digest}{ext}'
+        path = os.path.join(build_dir, built)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            _write(path, data)
+            # mtime 固定为 0，相同内容得到相同的 .gz
+            _write(path + '.gz', gzip.compress(data, compresslevel=gzip_level, mtime=0))
+            if brotli is not None:
+                _write(path + '.br', brotli.compress(data, quality=brotli_quality))
+        manifest[name] = built
+
+    _write(os.path.join(build_dir, MANIFEST_NAME),
+           json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+    return manifest
+
+
+class AssetPipeline:
+    """静态资源的构建产物：按清单把 static 链接换成带哈希的地址，并提供预压缩文件"""
+
+    def __init__(self, app=None, build_dir=None, sources=(), url_path='/assets'):
+        self.build_dir = build_dir
+        self.sources = list(sources)
+        self.url_path = url_path
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        if self.build_dir is None:
+            self.build_dir = os.path.join(app.static_folder, 'dist')
+        app.add_url_rule(f'{self.url_path}/<path:filename>', 'assets', self.serve)
+        app.add_template_global(self.asset_url)
+        self.load_manifest()
+
+    def build(self):
+        self.manifest = build_assets(self.static_folder, self.sources, self.build_dir)
+        return self.manifest
+
+    def load_manifest(self):
+        path = os.path.join(self.build_dir, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        return self.manifest
+
+    def asset_url(self, endpoint, **values):
+        """与 url_for 用法相同；static 下已构建的文件换成带哈希的地址"""
+        if endpoint == 'static':
+            built = self.manifest.get(values.get('filename'))
+            if built is not None:
+                values['filename'] = built
+                endpoint = 'assets'
+        return url_for(endpoint, **values)
+
+    def serve(self, filename):
+        path = safe_join(self.build_dir, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        ext = os.path.splitext(filename)[1]
+        served, encoding = filename, None
+        for name, suffix in ENCODINGS:
+            if request.accept_encodings[name] and os.path.isfile(path + suffix):
+                served, encoding = filename + suffix, name
+                break
+
+        response = send_from_directory(self.build_dir, served, mimetype=MIMETYPES.get(ext), max_age=31536000)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,260 @@
+import atexit
+import os
+import posixpath
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import url_for
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # 未安装 Pillow 时不生成缩略图，模板直接使用原图
+    Image = None
+
+AVATAR_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+# 缩略图放在原图所在目录的子目录里，文件名为 原文件名.尺寸.格式
+VARIANT_DIR = '_variants'
+
+# 格式 -> (Pillow 格式名, 保存参数)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+# 尚未生成缩略图的头像，隔多久再检查一次磁盘（其他进程可能已生成）
+MISSING_RECHECK_SECONDS = 60
+
+
+def variant_path(avatar, size, fmt):
+    """头像缩略图相对 static 目录的路径"""
+    folder, filename = posixpath.split(avatar)
+    return posixpath.join(folder, VARIANT_DIR, f'{filename}.{size}.{fmt}')
+
+
+def is_avatar_file(filename):
+    return filename.lower().endswith(AVATAR_EXTENSIONS)
+
+
+class AvatarRegistry:
+    """默认头像清单：创建时扫描一次目录，之后由后台线程按间隔检查目录 mtime，变化时重新扫描
+
+    请求里读取的都是内存中的清单，不访问文件系统。
+    """
+
+    def __init__(self, static_folder, folder, refresh_interval=300, on_change=None):
+        self.static_folder = static_folder
+        self.folder = folder
+        self.refresh_interval = refresh_interval
+        self.on_change = on_change
+        self.images = ()
+        self._known = frozenset()
+        self._mtime = None
+        self.lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.scan(notify=False)
+
+    @property
+    def directory(self):
+        return os.path.join(self.static_folder, *self.folder.split('/'))
+
+    def scan(self, notify=True):
+        """重新读取目录，返回头像路径（相对 static）的元组；目录不存在时为空"""
+        try:
+            mtime = os.stat(self.directory).st_mtime
+            files = os.listdir(self.directory)
+        except OSError:
+            mtime, files = None, []
+        images = tuple(sorted(f"{self.folder}/{f}" for f in files if is_avatar_file(f)))
+        with self.lock:
+            changed = images != self.images
+            self.images = images
+            self._known = frozenset(images)
+            self._mtime = mtime
+        if notify and changed and self.on_change is not None:
+            self.on_change(images)
+        return images
+
+    def refresh(self):
+        """目录 mtime 变化（增删文件）时才重新扫描，返回是否扫描过"""
+        try:
+            mtime = os.stat(self.directory).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self.scan()
+        return True
+
+    def __contains__(self, avatar):
+        return avatar in self._known
+
+    def __iter__(self):
+        return iter(self.images)
+
+    def __len__(self):
+        return len(self.images)
+
+    def choice(self):
+        images = self.images
+        return random.choice(images) if images else None
+
+    def start_background_task(self):
+        if not self.refresh_interval:
+            return
+        with self.lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._refresh_loop)
+            self._thread.daemon = True
+
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"刷新默认头像清单失败: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class AvatarPipeline:
+    """头像缩略图流水线：在线程池里解码原图，生成各尺寸的 WebP 与 JPEG"""
+
+    def __init__(self, static_folder, sizes=(40, 96, 256), max_workers=2):
+        self.static_folder = static_folder
+        self.sizes = tuple(sorted(sizes))
+        self.max_workers = max_workers
+        self.ready = set()
+        self.pending = set()
+        self.missing = {}
+        self.lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    def _file(self, relative):
+        return os.path.join(self.static_folder, *relative.split('/'))
+
+    def submit(self, avatar):
+        """把头像交给后台线程生成缩略图，已生成或排队中的直接跳过"""
+        if not self.enabled or not avatar:
+            return
+        with self.lock:
+            if avatar in self.ready or avatar in self.pending:
+                return
+            self.pending.add(avatar)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='avatar')
+        self._executor.submit(self._run, avatar)
+
+    def status(self):
+        """(None, 排队或正在生成缩略图的头像数)"""
+        with self.lock:
+            return None, len(self.pending)
+
+    def _run(self, avatar):
+        try:
+            if not self._variants_exist(avatar):
+                self.process(avatar)
+            with self.lock:
+                self.ready.add(avatar)
+                self.missing.pop(avatar, None)
+        except Exception as e:
+            print(f"生成头像缩略图失败 {avatar}: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(avatar)
+
+    def _variants_exist(self, avatar):
+        return all(os.path.exists(self._file(variant_path(avatar, size, fmt)))
+                   for size in self.sizes for fmt in VARIANT_FORMATS)
+
+    def process(self, avatar):
+        """裁成正方形并按各尺寸写出缩略图，先写临时文件再原子替换"""
+        with Image.open(self._file(avatar)) as source:
+            image = ImageOps.exif_transpose(source)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # JPEG 不支持透明，统一铺白底
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            else:
+                image = image.convert('RGB')
+
+            for size in self.sizes:
+                thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+                for fmt, (format_name, options) in VARIANT_FORMATS.items():
+                    target = self._file(variant_path(avatar, size, fmt))
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    temp = f'{target}.{os.getpid()}.tmp'
+                    thumbnail.save(temp, format_name, **options)
+                    os.replace(temp, target)
+
+    def save_upload(self, file, folder, user_id):
+        """校验并保存上传的头像，随后在后台生成缩略图；返回相对 static 的路径，不是图片时返回 None"""
+        ext = os.path.splitext(file.filename or '')[1].lower()
+        if ext not in AVATAR_EXTENSIONS:
+            return None
+        if self.enabled:
+            # 请求线程里只读文件头做校验，解码和缩放都交给线程池
+            try:
+                with Image.open(file.stream) as image:
+                    image.verify()
+            except Exception:
+                return None
+            file.stream.seek(0)
+
+        # 不使用用户提供的文件名，避免路径穿越和重名覆盖
+        avatar = posixpath.join(folder, f'{user_id}_{uuid.uuid4().hex[:12]}{ext}')
+        path = self._file(avatar)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file.save(path)
+        self.submit(avatar)
+        return avatar
+
+    def submit_all(self, avatars):
+        for avatar in avatars:
+            self.submit(avatar)
+
+    def is_ready(self, avatar):
+        """缩略图是否已生成；结果缓存在内存里，未生成的隔一段时间才重新检查磁盘"""
+        if not self.enabled or not avatar:
+            return False
+        now = time.time()
+        with self.lock:
+            if avatar in self.ready:
+                return True
+            if avatar in self.pending or self.missing.get(avatar, 0) > now:
+                return False
+
+        exists = self._variants_exist(avatar)
+        with self.lock:
+            if exists:
+                self.ready.add(avatar)
+            else:
+                self.missing[avatar] = now + MISSING_RECHECK_SECONDS
+        return exists
+
+    def url(self, avatar, size=96, fmt='jpg'):
+        """模板助手：取不小于 size 的最小缩略图，尚未生成时退回原图"""
+        if not self.is_ready(avatar):
+            return url_for('static', filename=avatar)
+        chosen = next((candidate for candidate in self.sizes if candidate >= size), self.sizes[-1])
+        return url_for('static', filename=variant_path(avatar, chosen, fmt))
+
+    def init_app(self, app):
+        app.add_template_global(self.url, 'avatar_url')
+        app.add_template_global(self.is_ready, 'avatar_ready')
@@ -0,0 +1,91 @@
+import threading
+import time
+
+STATS_TABLE = 'category_stats'
+
+
+def _category_key(category):
+    # 主键不能依赖 NULL，未分类统一记为空字符串
+    return category or ''
+
+
+class CategoryStats:
+    """各分类公开文章数的物化统计
+
+    统计表随文章的新增、删除、改分类、改可见性增量维护；
+    读取走进程内缓存，本进程写入后主动失效，其他进程依赖 ttl 过期。
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self.cache = None
+        self.expires_at = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def apply_change(conn, old=None, new=None):
+        """old / new 为变更前后的 (category, is_private)，新增时 old 为空，删除时 new 为空"""
+        deltas = {}
+        if old is not None and not old[1]:
+            key = _category_key(old[0])
+            deltas[key] = deltas.get(key, 0) - 1
+        if new is not None and not new[1]:
+            key = _category_key(new[0])
+            deltas[key] = deltas.get(key, 0) + 1
+
+        changed = False
+        for category, delta in deltas.items():
+            if not delta:
+                continue
+            conn.execute(f'''
+            INSERT INTO {STATS_TABLE} (category, article_count) VALUES (?, ?)
+            ON CONFLICT (category) DO UPDATE SET article_count = article_count + excluded.article_count
+            ''', (category, delta))
+            changed = True
+        return changed
+
+    @staticmethod
+    def create_table(conn):
+        conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+            category TEXT PRIMARY KEY,
+            article_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+
+    @staticmethod
+    def rebuild(conn, article_table):
+        """按文章表重新统计"""
+        conn.execute(f'DELETE FROM {STATS_TABLE}')
+        conn.execute(f'''
+        INSERT INTO {STATS_TABLE} (category, article_count)
+        SELECT COALESCE(category, ''), COUNT(*) FROM "{article_table}"
+        WHERE is_private = 0
+        GROUP BY COALESCE(category, '')
+        ''')
+
+    @staticmethod
+    def load(conn):
+        rows = conn.execute(f'''
+        SELECT category, article_count FROM {STATS_TABLE}
+        WHERE article_count > 0 ORDER BY category
+        ''').fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def get_counts(self, loader):
+        """返回 {分类: 公开文章数}，loader 在缓存失效时被调用以读取统计表"""
+        now = time.time()
+        with self.lock:
+            if self.cache is not None and self.expires_at > now:
+                return self.cache
+
+        counts = loader()
+
+        with self.lock:
+            self.cache = counts
+            self.expires_at = now + self.ttl
+        return counts
+
+    def invalidate(self):
+        with self.lock:
+            self.cache = None
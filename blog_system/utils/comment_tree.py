@@ -0,0 +1,23 @@
+def build_comment_tree(comments):
+    """在内存中组装评论树
+
+    comments 需按创建时间升序传入，每条评论挂上 children 列表（时间升序），
+    返回顶层评论列表（时间倒序，与页面展示一致）。父评论不存在的孤儿评论会被丢弃。
+    """
+    by_id = {}
+    for comment in comments:
+        comment.children = []
+        by_id[comment.id] = comment
+
+    roots = []
+    for comment in comments:
+        if comment.parent_id is None:
+            roots.append(comment)
+            continue
+
+        parent = by_id.get(int(comment.parent_id))
+        if parent is not None:
+            parent.children.append(comment)
+
+    roots.reverse()
+    return roots
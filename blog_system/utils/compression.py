@@ -0,0 +1,205 @@
+import itertools
+import threading
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:
+    # requirements.txt 声明了 Brotli；环境里缺少时退回只用 gzip
+    brotli = None
+
+# 值得压缩的内容类型；图片、字体、压缩包等本身已经压缩过
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/xhtml+xml',
+    'image/svg+xml',
+)
+
+# 没有响应体或不能改写响应体的状态码
+SKIP_STATUS = (204, 206, 304)
+
+
+class _GzipCompressor:
+    def __init__(self, level):
+        # wbits=31 输出带 gzip 头的格式
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        """流式响应每个分块后调用，保证客户端能立刻解出已收到的内容"""
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """按 Accept-Encoding 对 HTML / JSON 等文本响应做 gzip 或 brotli 压缩
+
+    已带 Content-Encoding 的响应（如预压缩的静态资源）、小于阈值的响应和非文本类型原样返回。
+    没有 Content-Length 的流式响应默认不压缩，开启 compress_streams 后逐块压缩并立即刷出。
+    skip_prefixes 下的路径不压缩：未带哈希的 /static 文件每次都要重新压缩，文本资源应走预压缩的 /assets。
+    """
+
+    def __init__(self, wsgi_app, min_size=500, level=6, brotli_quality=4, compress_streams=False,
+                 skip_prefixes=()):
+        self.wsgi_app = wsgi_app
+        self.skip_prefixes = tuple(skip_prefixes)
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.compress_streams = compress_streams
+        self.lock = threading.Lock()
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def choose_encoding(self, environ):
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and accept['br']:
+            return 'br'
+        if accept['gzip']:
+            return 'gzip'
+        return None
+
+    def _compressor(self, encoding):
+        if encoding == 'br':
+            return _BrotliCompressor(self.brotli_quality)
+        return _GzipCompressor(self.level)
+
+    def _compressible(self, status, headers):
+        if int(status.split(' ', 1)[0]) in SKIP_STATUS:
+            return False
+        if 'Content-Encoding' in headers:
+            return False
+        content_type = headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _record(self, compressed, bytes_in=0, bytes_out=0):
+        with self.lock:
+            if compressed:
+                self.compressed += 1
+                self.bytes_in += bytes_in
+                self.bytes_out += bytes_out
+            else:
+                self.skipped += 1
+
+    def __call__(self, environ, start_response):
+        encoding = self.choose_encoding(environ)
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.wsgi_app(environ, start_response)
+        if environ.get('PATH_INFO', '').startswith(self.skip_prefixes):
+            self._record(False)
+            return self.wsgi_app(environ, start_response)
+
+        captured = []
+        written = []
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return written.append
+
+        # Flask 在返回响应体之前就会调用 start_response
+        app_iter = self.wsgi_app(environ, capture_start_response)
+        status, headers, exc_info = captured
+        headers = Headers(headers)
+
+        # 没有 Content-Length 的是流式响应
+        streamed = 'Content-Length' not in headers
+        if not self._compressible(status, headers) or (streamed and not self.compress_streams):
+            self._record(False)
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return ClosingIterator(itertools.chain(written, app_iter), self._closer(app_iter))
+
+        if streamed:
+            self._prepare_headers(headers, encoding)
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return ClosingIterator(self._stream(itertools.chain(written, app_iter), encoding),
+                                   self._closer(app_iter))
+
+        try:
+            body = b''.join(written) + b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        if len(body) < self.min_size:
+            self._record(False)
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return [body]
+
+        compressor = self._compressor(encoding)
+        data = compressor.compress(body) + compressor.finish()
+        self._record(True, len(body), len(data))
+        self._prepare_headers(headers, encoding)
+        headers['Content-Length'] = str(len(data))
+        start_response(status, headers.to_wsgi_list(), exc_info)
+        return [data]
+
+    @staticmethod
+    def _closer(app_iter):
+        return getattr(app_iter, 'close', None)
+
+    @staticmethod
+    def _prepare_headers(headers, encoding):
+        headers['Content-Encoding'] = encoding
+        headers.remove('Content-Length')
+        vary = headers.get('Vary')
+        if not vary:
+            headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower():
+            headers['Vary'] = f'{vary}, Accept-Encoding'
+        # 压缩后的字节与原文不同，强 ETag 要降为弱 ETag
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = 'W/' + etag
+
+    def _stream(self, chunks, encoding):
+        compressor = self._compressor(encoding)
+        bytes_in = bytes_out = 0
+        for chunk in chunks:
+            if not chunk:
+                continue
+            bytes_in += len(chunk)
+            data = compressor.compress(chunk) + compressor.flush()
+            bytes_out += len(data)
+            yield data
+        data = compressor.finish()
+        bytes_out += len(data)
+        self._record(True, bytes_in, bytes_out)
+        yield data
+
+    def stats(self):
+        with self.lock:
+            saved = self.bytes_in - self.bytes_out
+            return {
+                'compressed': self.compressed,
+                'skipped': self.skipped,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'bytes_saved': saved,
+                'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+            }
@@ -0,0 +1,57 @@
+import hashlib
+from datetime import datetime, timezone
+
+from flask import request, session, make_response
+
+
+def _as_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        # 库里的时间都是 utcnow() 或 SQLite 的 CURRENT_TIMESTAMP，均为 UTC
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def last_modified_of(*values):
+    """取若干时间（datetime、SQLite 时间字符串或时间戳）中最晚的一个，转为 UTC datetime"""
+    timestamps = [ts for ts in map(_as_timestamp, values) if ts is not None]
+    if not timestamps:
+        return None
+    return datetime.fromtimestamp(int(max(timestamps)), timezone.utc)
+
+
+def compute_etag(*parts):
+    """由页面依赖的数据版本生成 ETag，当前登录用户也算在内"""
+    parts += (session.get('user_id'), session.get('is_vip'))
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def apply_validators(response, etag, last_modified=None):
+    """给响应加上 ETag / Last-Modified，并按请求的条件头转换成 304"""
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # 允许缓存但每次都要回源验证；登录用户的页面不能进共享缓存
+    response.headers['Cache-Control'] = 'private, no-cache' if 'user_id' in session else 'no-cache'
+    return response.make_conditional(request)
+
+
+def not_modified(etag, last_modified=None):
+    """在查库渲染之前判断能否直接回 304，可以则返回 304 响应，否则返回 None"""
+    if session.get('_flashes'):
+        # 有待显示的提示消息时必须重新渲染
+        return None
+    response = apply_validators(make_response(''), etag, last_modified)
+    return response if response.status_code == 304 else None
+
+
+def with_validators(body, etag, last_modified=None):
+    return apply_validators(make_response(body), etag, last_modified)
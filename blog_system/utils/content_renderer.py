@@ -0,0 +1,133 @@
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+
+# 渲染规则变化时递增，旧版本的 content_html 会在访问时或通过批量命令重新渲染
+RENDERER_VERSION = 1
+
+RERENDER_BATCH_SIZE = 200
+
+# 列表页摘要截取的字数，与迁移中回填用的 substr 长度一致
+EXCERPT_LENGTH = 200
+
+ALLOWED_TAGS = {
+    'a', 'b', 'blockquote', 'br', 'code', 'del', 'em', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'hr', 'i', 'img', 'li', 'ol', 'p', 'pre', 's', 'span', 'strong', 'sub', 'sup',
+    'table', 'tbody', 'td', 'th', 'thead', 'tr', 'u', 'ul',
+}
+VOID_TAGS = {'br', 'hr', 'img'}
+ALLOWED_ATTRS = {
+    'a': {'href', 'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan'},
+}
+URL_ATTRS = {'href', 'src'}
+SAFE_SCHEMES = {'', 'http', 'https', 'mailto'}
+# 连同内容一起丢弃的标签
+DROP_CONTENT_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'template'}
+
+
+def _safe_url(value):
+    value = (value or '').strip()
+    try:
+        scheme = urlparse(value).scheme.lower()
+    except ValueError:
+        return False
+    return scheme in SAFE_SCHEMES
+
+
+class _Sanitizer(HTMLParser):
+    """白名单过滤 HTML，正文中的换行转成 <br>（<pre> 内保留原样）"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open_tags = []
+        self.drop_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.drop_depth += 1
+            return
+        if self.drop_depth or tag not in ALLOWED_TAGS:
+            return
+
+        allowed = ALLOWED_ATTRS.get(tag, ())
+        parts = [tag]
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRS and not _safe_url(value):
+                continue
+            parts.append('%s="%s"' % (name, escape(value, quote=True)))
+        if tag == 'a':
+            parts.append('rel="nofollow noopener"')
+        self.out.append('<%s>' % ' '.join(parts))
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open_tags and self.open_tags[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.drop_depth = max(0, self.drop_depth - 1)
+            return
+        if self.drop_depth or tag not in self.open_tags:
+            return
+        # 自动补齐中间未闭合的标签
+        while self.open_tags:
+            current = self.open_tags.pop()
+            self.out.append('</%s>' % current)
+            if current == tag:
+                break
+
+    def handle_data(self, data):
+        if self.drop_depth:
+            return
+        text = escape(data, quote=False)
+        if 'pre' not in self.open_tags:
+            text = text.replace('\n', '<br>')
+        self.out.append(text)
+
+    def result(self):
+        self.close()
+        while self.open_tags:
+            self.out.append('</%s>' % self.open_tags.pop())
+        return ''.join(self.out)
+
+
+def render_content(content):
+    """把文章正文渲染成可直接输出的安全 HTML"""
+    sanitizer = _Sanitizer()
+    sanitizer.feed((content or '').replace('\r\n', '\n'))
+    return sanitizer.result()
+
+
+def make_excerpt(content):
+    """列表页用的正文摘要，写入时生成，列表查询因此不必读取整篇正文"""
+    return (content or '')[:EXCERPT_LENGTH]
+
+
+def rerender_stale(conn, article_table, force=False):
+    """按 id 分批重新渲染渲染版本过期（force 时为全部）的文章，返回处理的篇数"""
+    condition = '' if force else 'AND COALESCE(content_html_version, 0) != ?'
+    count = 0
+    last_id = 0
+    while True:
+        params = [last_id] if force else [last_id, RENDERER_VERSION]
+        rows = conn.execute(f'''
+        SELECT id, content FROM "{article_table}"
+        WHERE id > ? {condition}
+        ORDER BY id LIMIT {RERENDER_BATCH_SIZE}
+        ''', params).fetchall()
+        if not rows:
+            return count
+        conn.executemany(f'''
+        UPDATE "{article_table}" SET content_html = ?, content_html_version = ? WHERE id = ?
+        ''', [(render_content(row[1]), RENDERER_VERSION, row[0]) for row in rows])
+        count += len(rows)
+        last_id = rows[-1][0]
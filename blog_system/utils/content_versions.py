@@ -0,0 +1,41 @@
+import time
+
+VERSIONS_TABLE = 'content_versions'
+
+# 所有文章列表页（首页、搜索、个人主页）共用一个版本
+LIST_SCOPE = 'list'
+
+
+def article_scope(article_id):
+    """单篇文章的评论 / 点赞版本"""
+    return 'article:%s' % int(article_id)
+
+
+def create_versions_table(conn):
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (
+        scope TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL
+    )
+    ''')
+
+
+def bump_versions(conn, *scopes):
+    """内容变化时递增版本号，需和变更本身在同一个事务里提交"""
+    now = time.time()
+    conn.executemany(f'''
+    INSERT INTO {VERSIONS_TABLE} (scope, version, updated_at) VALUES (?, 1, ?)
+    ON CONFLICT (scope) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at
+    ''', [(scope, now) for scope in scopes])
+
+
+def load_versions(conn, *scopes):
+    """返回 {scope: (version, updated_at)}，从未变更过的 scope 为 (0, None)"""
+    placeholders = ','.join('?' * len(scopes))
+    rows = conn.execute(f'''
+    SELECT scope, version, updated_at FROM {VERSIONS_TABLE} WHERE scope IN ({placeholders})
+    ''', scopes).fetchall()
+    versions = {scope: (0, None) for scope in scopes}
+    versions.update((row[0], (row[1], row[2])) for row in rows)
+    return versions
@@ -0,0 +1,93 @@
+from sqlalchemy.orm import Session
+
+from models import db, Article, Comment, Like
+
+
+def adjust_counter(article_id, column, delta):
+    """在当前事务里原子地增减文章上的冗余计数"""
+    Article.query.filter_by(id=article_id).update(
+        {column: column + delta}, synchronize_session=False
+    )
+
+
+def get_like_count(article_id):
+    return db.session.query(Article.like_count).filter_by(id=article_id).scalar() or 0
+
+
+def flush_view_counts(batch, commit=None):
+    """把 {article_id: 增量} 在一个事务里批量加到 view_count 上；commit 见 ViewCounter"""
+    db.session.execute(
+        db.text('UPDATE article SET view_count = COALESCE(view_count, 0) + :delta WHERE id = :article_id'),
+        [{'article_id': article_id, 'delta': delta} for article_id, delta in batch.items()]
+    )
+    if commit is None:
+        db.session.commit()
+    else:
+        commit(db.session.commit)
+
+
+def _previous_value(obj, name):
+    history = db.inspect(obj).attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, name)
+
+
+def _category_state(obj, previous=False):
+    if previous:
+        return _previous_value(obj, 'category'), bool(_previous_value(obj, 'is_private'))
+    return obj.category, bool(obj.is_private)
+
+
+def track_category_stats(stats):
+    """监听 ORM 刷新，文章新增、删除、改分类或改可见性时在同一事务里维护分类统计"""
+
+    def before_flush(session, flush_context, instances):
+        changes = []
+        for obj in session.new:
+            if isinstance(obj, Article):
+                changes.append((None, _category_state(obj)))
+        for obj in session.deleted:
+            if isinstance(obj, Article):
+                changes.append((_category_state(obj, previous=True), None))
+        for obj in session.dirty:
+            if isinstance(obj, Article):
+                old, new = _category_state(obj, previous=True), _category_state(obj)
+                if old != new:
+                    changes.append((old, new))
+        if not changes:
+            return
+
+        conn = session.connection().connection.dbapi_connection
+        for old, new in changes:
+            if stats.apply_change(conn, old, new):
+                session.info['category_stats_changed'] = True
+
+    def after_commit(session):
+        if session.info.pop('category_stats_changed', False):
+            stats.invalidate()
+
+    def after_rollback(session):
+        session.info.pop('category_stats_changed', None)
+
+    db.event.listen(Session, 'before_flush', before_flush)
+    db.event.listen(Session, 'after_commit', after_commit)
+    db.event.listen(Session, 'after_rollback', after_rollback)
+
+
+def repair_counters():
+    """按 like / comment 表重新计算所有文章的计数，返回更新的文章数"""
+    like_total = db.select(db.func.count(Like.id)).where(
+        Like.article_id == Article.id
+    ).scalar_subquery()
+    comment_total = db.select(db.func.count(Comment.id)).where(
+        Comment.article_id == Article.id
+    ).scalar_subquery()
+
+    result = db.session.execute(
+        db.update(Article).values(like_count=like_total, comment_count=comment_total)
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, session, has_request_context
+
+# 快照里保存的用户字段（不含密码哈希）
+USER_FIELDS = ('id', 'username', 'email', 'avatar', 'is_vip', 'wallet_balance', 'created_at')
+
+
+class UserSnapshot:
+    """缓存里的用户只读快照，字段与 User 相同，但不绑定数据库会话或连接"""
+
+    __slots__ = USER_FIELDS
+
+    def __init__(self, **fields):
+        for name in USER_FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def of(cls, user):
+        if user is None:
+            return None
+        return cls(**{name: getattr(user, name, None) for name in USER_FIELDS})
+
+
+class UserCache:
+    """跨请求的用户快照缓存：短 TTL 兜底多进程之间的不一致，本进程内靠版本号失效
+
+    更新 VIP、余额、头像后调用 invalidate；版本号保证失效前开始、失效后才读完的旧数据不会写回缓存。
+    """
+
+    def __init__(self, loader, ttl=30, max_entries=2000):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # user_id -> (版本号, 过期时间, 快照)
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        now = time.time()
+        with self.lock:
+            version = self.versions.get(user_id, 0)
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] == version and entry[1] > now:
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        snapshot = self.loader(user_id)
+        with self.lock:
+            if snapshot is not None and self.versions.get(user_id, 0) == version:
+                self.entries[user_id] = (version, now + self.ttl, snapshot)
+                self.entries.move_to_end(user_id)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.versions[user_id] = self.versions.get(user_id, 0) + 1
+            self.entries.pop(user_id, None)
+            self.invalidations += 1
+        if has_request_context():
+            g.pop('_current_user', None)
+
+    def current(self):
+        """当前请求的登录用户，每个请求只解析一次；未登录或用户不存在时返回 None"""
+        user_id = session.get('user_id')
+        if user_id is None:
+            return None
+        user = g.get('_current_user')
+        if user is None or user.id != user_id:
+            user = g._current_user = self.get(user_id)
+        return user
+
+    def sync_session(self):
+        """以缓存中的用户为准更新会话里的 is_vip，避免会话里的旧值一直生效"""
+        user = self.current()
+        if user is not None and session.get('is_vip') != bool(user.is_vip):
+            session['is_vip'] = bool(user.is_vip)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+            }
@@ -0,0 +1,82 @@
+import threading
+
+from werkzeug.wsgi import ClosingIterator
+
+# 请求的 environ 里记录本次请求归属的端点，结束时按它减计数
+ENVIRON_KEY = 'blog.in_flight'
+
+
+class InFlightGauge:
+    """正在处理的请求数：总数、按端点的并发数，以及每个统计周期内的最高值
+
+    计数在 WSGI 层加减：进入应用时加一，响应体迭代器关闭时减一。异常路径和流式响应
+    （响应体在视图函数返回之后才生成）因此都能正确减掉，每个请求只会减一次。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0
+        self.peak = 0
+        self.endpoints = {}
+        self.endpoint_peaks = {}
+
+    def wrap(self, wsgi_app):
+        def middleware(environ, start_response):
+            self.start(environ)
+            try:
+                app_iter = wsgi_app(environ, start_response)
+            except BaseException:
+                self.finish(environ)
+                raise
+            return ClosingIterator(app_iter, lambda: self.finish(environ))
+        return middleware
+
+    def start(self, environ):
+        with self.lock:
+            self.total += 1
+            if self.total > self.peak:
+                self.peak = self.total
+        environ[ENVIRON_KEY] = None
+
+    def assign(self, environ, endpoint):
+        """路由匹配后把请求记到端点名下，未经过 wrap 的请求忽略"""
+        if environ.get(ENVIRON_KEY, False) is not None:
+            return
+        environ[ENVIRON_KEY] = endpoint
+        with self.lock:
+            current = self.endpoints.get(endpoint, 0) + 1
+            self.endpoints[endpoint] = current
+            if current > self.endpoint_peaks.get(endpoint, 0):
+                self.endpoint_peaks[endpoint] = current
+
+    def finish(self, environ):
+        if ENVIRON_KEY not in environ:
+            return
+        endpoint = environ.pop(ENVIRON_KEY)
+        with self.lock:
+            self.total = max(0, self.total - 1)
+            if endpoint is not None:
+                current = self.endpoints.get(endpoint, 0) - 1
+                if current > 0:
+                    self.endpoints[endpoint] = current
+                else:
+                    self.endpoints.pop(endpoint, None)
+
+    def reset_peaks(self):
+        """结束一个统计周期：返回本周期的最高并发数，下个周期从当前值重新开始"""
+        with self.lock:
+            peak = self.peak
+            self.peak = self.total
+            self.endpoint_peaks = dict(self.endpoints)
+        return peak
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'in_flight': self.total,
+                'peak': self.peak,
+                'endpoints': {
+                    endpoint: {'in_flight': self.endpoints.get(endpoint, 0), 'peak': peak}
+                    for endpoint, peak in sorted(self.endpoint_peaks.items())
+                },
+            }
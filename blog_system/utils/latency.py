@@ -0,0 +1,125 @@
+import bisect
+import math
+import threading
+import time
+
+from utils.sliding_window import DEFAULT_WINDOWS, window_label
+
+# 桶上界（毫秒）：从 0.1 ms 起每个桶放大 2^(1/4) 倍（约 19%），最大约 52 秒，更慢的进最后一个溢出桶
+BUCKET_GROWTH = 2 ** 0.25
+BUCKET_BOUNDS = tuple(0.1 * BUCKET_GROWTH ** i for i in range(int(math.log(600000, BUCKET_GROWTH)) + 1))
+
+# 汇总所有端点的键
+ALL_ENDPOINTS = '*'
+
+PERCENTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99))
+
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图，分位数取所在桶的上界，相对误差不超过一个桶宽"""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def merge(self, other):
+        counts = self.counts
+        for i, value in enumerate(other.counts):
+            if value:
+                counts[i] += value
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        cumulative = 0
+        for i, value in enumerate(self.counts):
+            cumulative += value
+            if cumulative >= rank:
+                bound = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        result = {'count': self.count}
+        if not self.count:
+            result.update(avg=None, max=None, **{name: None for name, _ in PERCENTILES})
+            return result
+        result['avg'] = round(self.total / self.count, 2)
+        for name, q in PERCENTILES:
+            result[name] = round(self.percentile(q), 2)
+        result['max'] = round(self.max, 2)
+        return result
+
+
+class LatencyTracker:
+    """按端点统计请求延迟：每 slot_seconds 秒一个直方图，环形保留到最大窗口，查询时合并窗口内的槽
+
+    记录一次只是一次二分查找加几次计数，查询时才合并直方图。
+    """
+
+    def __init__(self, windows=DEFAULT_WINDOWS, slot_seconds=10):
+        self.windows = tuple(sorted(windows))
+        self.slot_seconds = slot_seconds
+        self.slot_count = self.windows[-1] // slot_seconds
+        # 端点 -> 环形数组，每个元素为 (槽号, 直方图) 或 None
+        self.rings = {}
+        self.lock = threading.Lock()
+
+    def _slot(self):
+        return int(time.time() // self.slot_seconds)
+
+    def record(self, endpoint, ms):
+        slot = self._slot()
+        index = slot % self.slot_count
+        with self.lock:
+            for key in (endpoint, ALL_ENDPOINTS):
+                ring = self.rings.get(key)
+                if ring is None:
+                    ring = self.rings[key] = [None] * self.slot_count
+                entry = ring[index]
+                if entry is None or entry[0] != slot:
+                    entry = ring[index] = (slot, LatencyHistogram())
+                entry[1].record(ms)
+
+    def histogram(self, endpoint=ALL_ENDPOINTS, window=60):
+        """合并最近 window 秒（按槽对齐）内的直方图"""
+        first = self._slot() - window // self.slot_seconds + 1
+        merged = LatencyHistogram()
+        with self.lock:
+            for entry in self.rings.get(endpoint, ()):
+                if entry is not None and entry[0] >= first:
+                    merged.merge(entry[1])
+        return merged
+
+    def endpoints(self):
+        with self.lock:
+            return sorted(key for key in self.rings if key != ALL_ENDPOINTS)
+
+    def summary(self, endpoint=ALL_ENDPOINTS):
+        """各窗口的 count / avg / p50 / p90 / p99 / max，键为 1m、5m、15m"""
+        return {window_label(window): self.histogram(endpoint, window).summary()
+                for window in self.windows}
+
+    def report(self):
+        endpoints = {}
+        for endpoint in self.endpoints():
+            summary = self.summary(endpoint)
+            # 最大窗口内都没有请求的端点不再列出
+            if summary[window_label(self.windows[-1])]['count']:
+                endpoints[endpoint] = summary
+        return {'overall': self.summary(), 'endpoints': endpoints}
@@ -0,0 +1,85 @@
+import bisect
+import threading
+
+
+class LeaderboardEntry:
+    """排行榜里的一篇文章，view_count 已包含尚未落库的阅读数"""
+
+    __slots__ = ('id', 'title', 'category', 'view_count')
+
+    def __init__(self, id, title, category, view_count):
+        self.id = id
+        self.title = title
+        self.category = category
+        self.view_count = view_count
+
+
+class Leaderboard:
+    """热门文章排行榜：全站一份，每个分类各一份，只保留前 size 篇
+
+    阅读数只增不减，所以榜外文章只有在超过榜尾时才需要进榜，
+    每次阅读只需和榜尾比较；读取直接返回不可变快照，不查库。
+    """
+
+    def __init__(self, size=5):
+        self.size = size
+        self.boards = {}
+        self.snapshots = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def top(self, category=None):
+        """返回全站或某分类的热门文章元组"""
+        return self.snapshots.get(category, ())
+
+    def update(self, article_id, title, category, view_count):
+        with self.lock:
+            self._update_board(None, article_id, title, category, view_count)
+            self._update_board(category, article_id, title, category, view_count)
+
+    def discard(self, article_id):
+        """文章被删除或设为私密时移出所有榜单"""
+        with self.lock:
+            for key, board in self.boards.items():
+                kept = [item for item in board if item[1] != article_id]
+                if len(kept) != len(board):
+                    self.boards[key] = kept
+                    self._publish(key)
+
+    def _update_board(self, key, article_id, title, category, view_count):
+        board = self.boards.setdefault(key, [])
+        # 按 (-阅读数, -id) 升序排列，即阅读数倒序
+        sort_key = (-view_count, -article_id)
+        old = next((i for i, item in enumerate(board) if item[1] == article_id), None)
+
+        if old is None and len(board) >= self.size and sort_key >= board[-1][0]:
+            return
+        if old is not None:
+            board.pop(old)
+
+        bisect.insort(board, (sort_key, article_id, LeaderboardEntry(article_id, title, category, view_count)))
+        del board[self.size:]
+        self._publish(key)
+
+    def _publish(self, key):
+        self.snapshots[key] = tuple(item[2] for item in self.boards[key])
+
+    def rebuild(self, conn, article_table):
+        """从数据库重建所有榜单，一次窗口函数查询取回每个分类的前 size 篇"""
+        rows = conn.execute(f'''
+        SELECT id, title, category, view_count FROM (
+            SELECT id, title, category, COALESCE(view_count, 0) AS view_count,
+                   ROW_NUMBER() OVER (PARTITION BY category ORDER BY view_count DESC, id DESC) AS rank
+            FROM "{article_table}" WHERE is_private = 0
+        ) WHERE rank <= ?
+        ''', (self.size,)).fetchall()
+
+        with self.lock:
+            self.boards = {}
+            self.snapshots = {}
+            for row in rows:
+                self._update_board(None, row[0], row[1], row[2], row[3])
+                self._update_board(row[2], row[0], row[1], row[2], row[3])
+            self.boards.setdefault(None, [])
+            self._publish(None)
+            self.loaded = True
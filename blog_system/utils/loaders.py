@@ -0,0 +1,135 @@
+from datetime import datetime
+
+from flask_sqlalchemy.pagination import Pagination
+
+from models import db, Article, Comment, Like
+from utils.comment_tree import build_comment_tree
+from utils.search_engine import SearchIndex
+from utils.pagination import decode_cursor, build_keyset_page
+from utils.content_renderer import render_content, make_excerpt, RENDERER_VERSION
+
+search_index = SearchIndex('article', 'article_fts')
+
+
+def raw_connection():
+    """当前会话事务使用的 DB-API 连接，供 FTS 等原生 SQL 与 ORM 写入共用一个事务"""
+    return db.session.connection().connection.dbapi_connection
+
+
+def with_author(query):
+    """列表查询预加载作者，避免模板里逐条访问 article.author"""
+    # author 是 User.articles 的 backref，映射配置完成后才会挂到 Article 上
+    db.configure_mappers()
+    return query.options(db.joinedload(Article.author))
+
+
+def for_list(query):
+    """列表页查询：预加载作者，并且不加载正文，模板只用 summary / excerpt"""
+    return with_author(query).options(db.defer(Article.content), db.defer(Article.content_html))
+
+
+def load_liked_ids(user_id, article_ids):
+    """一次查询取回当前用户点赞过的文章 id 集合"""
+    if not user_id or not article_ids:
+        return set()
+
+    rows = db.session.query(Like.article_id).filter(
+        Like.user_id == user_id,
+        Like.article_id.in_(article_ids)
+    ).all()
+
+    return {article_id for (article_id,) in rows}
+
+
+def _article_key(article):
+    return article.created_at, article.id
+
+
+def _parse_cursor(token):
+    cursor = decode_cursor(token)
+    if cursor is None:
+        return None
+    try:
+        return datetime.fromisoformat(cursor[0]), cursor[1]
+    except ValueError:
+        return None
+
+
+def keyset_paginate(query, per_page, after=None, before=None):
+    """按 (created_at, id) 倒序做游标翻页，query 不应再带 order_by"""
+    key = db.tuple_(Article.created_at, Article.id)
+
+    cursor = _parse_cursor(before)
+    if cursor is not None:
+        rows = query.filter(key > cursor).order_by(
+            Article.created_at.asc(), Article.id.asc()
+        ).limit(per_page + 1).all()
+        return build_keyset_page(rows, per_page, _article_key, before=True)
+
+    cursor = _parse_cursor(after)
+    if cursor is not None:
+        query = query.filter(key < cursor)
+    rows = query.order_by(
+        Article.created_at.desc(), Article.id.desc()
+    ).limit(per_page + 1).all()
+    return build_keyset_page(rows, per_page, _article_key, has_cursor=cursor is not None)
+
+
+def render_article(article):
+    """渲染并过滤正文，写入 content_html 和列表摘要；文章新增、修改正文或渲染版本过期时调用"""
+    article.content_html = render_content(article.content)
+    article.content_html_version = RENDERER_VERSION
+    article.excerpt = make_excerpt(article.content)
+
+
+def search_ready():
+    return search_index.is_ready(raw_connection())
+
+
+def index_article(article):
+    """文章新增或修改后同步全文索引，需在提交前调用"""
+    if not search_ready():
+        return
+    db.session.flush()
+    search_index.index_article(raw_connection(), article.id, article.title,
+                               article.summary, article.tags, article.content)
+
+
+class SearchPagination(Pagination):
+    """全文检索结果分页，按 bm25 相关度排序，接口与 Query.paginate() 一致"""
+
+    def _query_items(self):
+        ids, self._total = search_index.search(
+            raw_connection(),
+            self._query_args['keyword'],
+            category=self._query_args.get('category'),
+            limit=self.per_page,
+            offset=self._query_offset
+        )
+        if not ids:
+            return []
+
+        articles = for_list(Article.query).filter(Article.id.in_(ids)).all()
+        by_id = {article.id: article for article in articles}
+        return [by_id[article_id] for article_id in ids if article_id in by_id]
+
+    def _query_count(self):
+        return self._total
+
+
+def load_comment_tree(article_id):
+    """一次查询取回文章全部评论及作者，在内存中组装成评论树"""
+    db.configure_mappers()
+    comments = Comment.query.options(db.joinedload(Comment.author)).filter_by(
+        article_id=article_id
+    ).order_by(Comment.created_at.asc(), Comment.id.asc()).all()
+
+    return build_comment_tree(comments)
+
+
+def load_list_context(articles, user_id=None):
+    """为文章列表准备模板所需的点赞状态，点赞数直接读 article.like_count"""
+    article_ids = [article.id for article in articles]
+    return {
+        'liked_ids': load_liked_ids(user_id, article_ids),
+    }
@@ -0,0 +1,237 @@
+"""OpenMetrics 文本格式的指标导出
+
+请求计数与耗时直方图、数据库查询、缓存命中和后台任务积压都汇总到 MetricsRegistry，
+由 /metrics 一次性渲染，供 Prometheus 抓取。计数器从进程启动开始累计，多进程部署时逐个 worker 抓取。
+"""
+
+import sqlite3
+import threading
+import time
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# 耗时直方图的桶上界（秒）
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = 'blog'
+
+# 没有匹配到路由的请求（如 404）记在这个端点名下
+UNMATCHED_ENDPOINT = '<unmatched>'
+
+
+class Histogram:
+    """累计直方图，计数只增不减；调用方负责加锁"""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """[(le, 累计数)]，最后一项为 +Inf"""
+        result = []
+        total = 0
+        for bound, value in zip(self.buckets, self.counts):
+            total += value
+            result.append((_format_value(bound), total))
+        result.append(('+Inf', self.count))
+        return result
+
+
+def _operation(statement):
+    """SQL 语句的类型，作为查询指标的标签"""
+    words = statement.lstrip().split(None, 1)
+    operation = words[0].upper() if words else ''
+    return operation if operation in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'OTHER'
+
+
+class QueryStats:
+    """数据库查询次数与耗时，按语句类型分组"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, statement, seconds):
+        operation = _operation(statement)
+        with self.lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = Histogram()
+            histogram.observe(seconds)
+
+    def connection_factory(self):
+        """sqlite3.connect 的 factory：execute / executemany 都计时
+
+        SQLAlchemy 通过 connect_args 使用同一个 factory，ORM 和 raw_connection 上的原生 SQL 都只计一次。
+        """
+        stats = self
+
+        class TimedCursor(sqlite3.Cursor):
+            def execute(self, sql, parameters=()):
+                started = time.perf_counter()
+                try:
+                    return super().execute(sql, parameters)
+                finally:
+                    stats.record(sql, time.perf_counter() - started)
+
+            def executemany(self, sql, seq_of_parameters):
+                started = time.perf_counter()
+                try:
+                    return super().executemany(sql, seq_of_parameters)
+                finally:
+                    stats.record(sql, time.perf_counter() - started)
+
+        class TimedConnection(sqlite3.Connection):
+            def cursor(self, factory=TimedCursor):
+                return super().cursor(factory)
+
+            def execute(self, sql, parameters=()):
+                return self.cursor().execute(sql, parameters)
+
+            def executemany(self, sql, seq_of_parameters):
+                return self.cursor().executemany(sql, seq_of_parameters)
+
+        return TimedConnection
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class _Writer:
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, metric_type, help_text, unit=None):
+        self.lines.append(f'# TYPE {PREFIX}_{name} {metric_type}')
+        if unit:
+            self.lines.append(f'# UNIT {PREFIX}_{name} {unit}')
+        self.lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+
+    def sample(self, name, value, **labels):
+        if labels:
+            rendered = ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+            self.lines.append(f'{PREFIX}_{name}{{{rendered}}} {_format_value(value)}')
+        else:
+            self.lines.append(f'{PREFIX}_{name} {_format_value(value)}')
+
+    def histogram(self, name, histogram, **labels):
+        for le, count in histogram.cumulative():
+            self.sample(f'{name}_bucket', count, **labels, le=le)
+        self.sample(f'{name}_count', histogram.count, **labels)
+        self.sample(f'{name}_sum', histogram.sum, **labels)
+
+    def render(self):
+        self.lines.append('# EOF')
+        return '\n'.join(self.lines) + '\n'
+
+
+class MetricsRegistry:
+    """NetworkMonitor 的指标汇总：请求按端点和状态码计数计时，其余指标在渲染时向各组件取值"""
+
+    def __init__(self, in_flight, queries=None):
+        self.in_flight = in_flight
+        self.queries = queries if queries is not None else QueryStats()
+        self.requests = {}
+        self.caches = {}
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    def record_request(self, endpoint, method, status, seconds):
+        key = (endpoint, method, str(status))
+        with self.lock:
+            histogram = self.requests.get(key)
+            if histogram is None:
+                histogram = self.requests[key] = Histogram()
+            histogram.observe(seconds)
+
+    def register_cache(self, name, stats_func):
+        """stats_func() 返回含 hits / misses 的字典"""
+        self.caches[name] = stats_func
+
+    def register_task(self, name, status_func):
+        """status_func() 返回 (距上次完成的秒数或 None, 积压数量)"""
+        self.tasks[name] = status_func
+
+    def render(self):
+        writer = _Writer()
+
+        with self.lock:
+            requests = [(key, _copy(histogram)) for key, histogram in sorted(self.requests.items())]
+        writer.family('http_requests', 'counter', '按端点、方法和状态码统计的请求数')
+        for (endpoint, method, status), histogram in requests:
+            writer.sample('http_requests_total', histogram.count, endpoint=endpoint, method=method, status=status)
+        writer.family('http_request_duration_seconds', 'histogram', '请求处理耗时', unit='seconds')
+        for (endpoint, method, status), histogram in requests:
+            writer.histogram('http_request_duration_seconds', histogram,
+                             endpoint=endpoint, method=method, status=status)
+
+        in_flight = self.in_flight.snapshot()
+        writer.family('http_requests_in_flight', 'gauge', '正在处理的请求数')
+        writer.sample('http_requests_in_flight', in_flight['in_flight'])
+        writer.family('http_endpoint_requests_in_flight', 'gauge', '按端点统计的正在处理的请求数')
+        for endpoint, values in in_flight['endpoints'].items():
+            writer.sample('http_endpoint_requests_in_flight', values['in_flight'], endpoint=endpoint)
+        writer.family('http_requests_in_flight_peak', 'gauge', '本统计周期内的最高并发请求数')
+        writer.sample('http_requests_in_flight_peak', in_flight['peak'])
+
+        with self.queries.lock:
+            queries = [(operation, _copy(histogram)) for operation, histogram in sorted(self.queries.histograms.items())]
+        writer.family('db_queries', 'counter', '按语句类型统计的数据库查询数')
+        for operation, histogram in queries:
+            writer.sample('db_queries_total', histogram.count, operation=operation)
+        writer.family('db_query_duration_seconds', 'histogram', '数据库查询耗时', unit='seconds')
+        for operation, histogram in queries:
+            writer.histogram('db_query_duration_seconds', histogram, operation=operation)
+
+        caches = {name: stats_func() for name, stats_func in self.caches.items()}
+        writer.family('cache_hits', 'counter', '缓存命中次数')
+        for name, stats in caches.items():
+            writer.sample('cache_hits_total', stats['hits'], cache=name)
+        writer.family('cache_misses', 'counter', '缓存未命中次数')
+        for name, stats in caches.items():
+            writer.sample('cache_misses_total', stats['misses'], cache=name)
+        writer.family('cache_hit_ratio', 'gauge', '缓存命中率（0-1）')
+        for name, stats in caches.items():
+            lookups = stats['hits'] + stats['misses']
+            writer.sample('cache_hit_ratio', stats['hits'] / lookups if lookups else 0.0, cache=name)
+
+        tasks = {name: status_func() for name, status_func in self.tasks.items()}
+        writer.family('background_lag_seconds', 'gauge', '后台任务距上次完成的秒数', unit='seconds')
+        for name, (lag, _) in tasks.items():
+            if lag is not None:
+                writer.sample('background_lag_seconds', lag, task=name)
+        writer.family('background_pending', 'gauge', '后台任务积压的待处理数量')
+        for name, (_, pending) in tasks.items():
+            writer.sample('background_pending', pending, task=name)
+
+        return writer.render()
+
+
+def _copy(histogram):
+    """渲染前在锁内复制一份，渲染过程中不持锁"""
+    copied = Histogram(histogram.buckets)
+    copied.counts = list(histogram.counts)
+    copied.count = histogram.count
+    copied.sum = histogram.sum
+    return copied
@@ -0,0 +1,158 @@
+"""SQLite 数据库结构的版本化迁移
+
+已执行的版本记录在 schema_version 表中，每个迁移本身也写成可重复执行的形式，
+因此启动时反复调用 run_migrations 是安全的。两套模型的表名不同，
+通过 tables 映射传入：{'article': ..., 'comment': ..., 'like': ..., 'network_stats': ...}
+"""
+
+from utils.category_stats import CategoryStats
+from utils.related import RelatedArticles
+from utils.content_versions import create_versions_table
+from utils.content_renderer import EXCERPT_LENGTH
+from utils.timeseries import create_rollup_table
+
+# 热点查询所需的二级索引：(索引名, 表, 列, 是否唯一)
+INDEXES = [
+    ('ix_article_private_created', 'article', ('is_private', 'created_at'), False),
+    ('ix_article_private_views', 'article', ('is_private', 'view_count'), False),
+    ('ix_article_category_private', 'article', ('category', 'is_private'), False),
+    ('ix_article_user_created', 'article', ('user_id', 'created_at'), False),
+    ('ix_comment_article_parent_created', 'comment', ('article_id', 'parent_id', 'created_at'), False),
+    ('ix_like_article', 'like', ('article_id',), False),
+    ('ux_like_user_article', 'like', ('user_id', 'article_id'), True),
+    ('ix_network_stats_timestamp', 'network_stats', ('timestamp',), False),
+]
+
+
+def _quote(name):
+    return '"%s"' % name
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({_quote(table)})').fetchall()}
+
+
+def recount_sql(tables):
+    """按明细表重算文章冗余计数的 SQL"""
+    article, comment, like = (_quote(tables[name]) for name in ('article', 'comment', 'like'))
+    return f'''
+    UPDATE {article} SET
+        like_count = (SELECT COUNT(*) FROM {like} WHERE {like}.article_id = {article}.id),
+        comment_count = (SELECT COUNT(*) FROM {comment} WHERE {comment}.article_id = {article}.id)
+    '''
+
+
+def add_counter_columns(conn, tables):
+    article = tables['article']
+    missing = [name for name in ('like_count', 'comment_count') if name not in _columns(conn, article)]
+    for name in missing:
+        conn.execute(f'ALTER TABLE {_quote(article)} ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0')
+    if missing:
+        conn.execute(recount_sql(tables))
+
+
+def create_hot_path_indexes(conn, tables):
+    like = _quote(tables['like'])
+    # 唯一索引建立前先清理重复点赞，只保留最早的一条
+    removed = conn.execute(f'''
+    DELETE FROM {like} WHERE id NOT IN (
+        SELECT MIN(id) FROM {like} GROUP BY user_id, article_id
+    )
+    ''').rowcount
+    if removed:
+        conn.execute(recount_sql(tables))
+
+    for name, table, columns, unique in INDEXES:
+        conn.execute('CREATE {unique}INDEX IF NOT EXISTS {name} ON {table} ({columns})'.format(
+            unique='UNIQUE ' if unique else '',
+            name=name,
+            table=_quote(tables[table]),
+            columns=', '.join(columns)
+        ))
+
+
+def create_category_stats(conn, tables):
+    CategoryStats.create_table(conn)
+    CategoryStats.rebuild(conn, tables['article'])
+
+
+def create_related_table(conn, tables):
+    # 只建表，内容由启动后的后台任务逐篇补算
+    RelatedArticles.create_table(conn)
+
+
+def create_content_versions(conn, tables):
+    create_versions_table(conn)
+
+
+def add_content_html_columns(conn, tables):
+    # 已有文章不在这里渲染，由访问时的惰性渲染或 rerender-articles 命令补齐
+    article = tables['article']
+    columns = _columns(conn, article)
+    if 'content_html' not in columns:
+        conn.execute(f'ALTER TABLE {_quote(article)} ADD COLUMN content_html TEXT')
+    if 'content_html_version' not in columns:
+        conn.execute(f'ALTER TABLE {_quote(article)} ADD COLUMN content_html_version INTEGER NOT NULL DEFAULT 0')
+
+
+def add_excerpt_column(conn, tables):
+    article = _quote(tables['article'])
+    if 'excerpt' not in _columns(conn, tables['article']):
+        conn.execute(f'ALTER TABLE {article} ADD COLUMN excerpt TEXT')
+    conn.execute(f'UPDATE {article} SET excerpt = substr(content, 1, ?) WHERE excerpt IS NULL', (EXCERPT_LENGTH,))
+
+
+def add_peak_connections_column(conn, tables):
+    if 'peak_connections' not in _columns(conn, tables['network_stats']):
+        conn.execute(f'ALTER TABLE {_quote(tables["network_stats"])} ADD COLUMN peak_connections INTEGER')
+
+
+def create_network_rollups(conn, tables):
+    create_rollup_table(conn)
+
+
+MIGRATIONS = [
+    (1, '文章冗余点赞数/评论数列', add_counter_columns),
+    (2, '热点查询索引与点赞唯一约束', create_hot_path_indexes),
+    (3, '分类文章数物化统计表', create_category_stats),
+    (4, '相关文章查找表', create_related_table),
+    (5, '条件请求使用的内容版本表', create_content_versions),
+    (6, '预渲染的文章正文 HTML', add_content_html_columns),
+    (7, '列表页使用的正文摘要列', add_excerpt_column),
+    (8, '网络统计每个周期的最高并发数', add_peak_connections_column),
+    (9, '网络统计的分钟/小时/天汇总表', create_network_rollups),
+]
+
+
+def current_version(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn, tables):
+    """依次执行尚未应用的迁移，每个版本单独提交，返回执行过的版本号列表"""
+    applied = []
+    version = current_version(conn)
+    conn.commit()
+
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        try:
+            migrate(conn, tables)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (number, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(number)
+
+    return applied
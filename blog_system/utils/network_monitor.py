@@ -1,47 +1,86 @@
 import time
 import threading
 from datetime import datetime
+from flask import g, request
 from models import db, NetworkStats
+from utils.sliding_window import SlidingWindowCounter, window_label
+from utils.latency import LatencyTracker
+from utils.inflight import InFlightGauge
+from utils.timeseries import NetworkHistory
+from utils.metrics import MetricsRegistry, UNMATCHED_ENDPOINT
+from utils.loaders import raw_connection
 
 class NetworkMonitor:
-    def __init__(self, app):
+    def __init__(self, app, queries=None):
         self.app = app
-        self.request_times = []
-        self.active_connections = 0
+        self.requests = SlidingWindowCounter()
+        self.latency = LatencyTracker()
+        # 正在处理的请求数，由 wrap_wsgi 包装的 WSGI 层在请求开始和结束时加减
+        self.in_flight = InFlightGauge()
+        self.sample_interval = app.config['NETWORK_SAMPLE_INTERVAL']
+        self.history = NetworkHistory('network_stats', self.sample_interval,
+                                      app.config['NETWORK_RETENTION_DAYS'],
+                                      app.config['NETWORK_HISTORY_MAX_POINTS'])
+        # 数据库查询由 app.py 给引擎配置的计时连接记录
+        self.metrics = MetricsRegistry(self.in_flight, queries)
+        self.last_sample_at = None
+        self.metrics.register_task('network_stats', self._sample_status)
         self.lock = threading.Lock()
+    
+    def wrap_wsgi(self, wsgi_app):
+        return self.in_flight.wrap(wsgi_app)
         
     def record_request(self):
-        with self.lock:
-            current_time = time.time()
-            self.request_times.append(current_time)
-            self.active_connections += 1
-            
-            cutoff_time = current_time - 60
-            self.request_times = [t for t in self.request_times if t > cutoff_time]
+        self.requests.record()
+        g._monitor_started = time.perf_counter()
+        self.in_flight.assign(request.environ, request.endpoint or UNMATCHED_ENDPOINT)
     
-    def request_completed(self):
-        with self.lock:
-            self.active_connections = max(0, self.active_connections - 1)
+    def record_response(self, endpoint, status):
+        """在 after_request 中调用，把本次请求的处理耗时计入端点的延迟直方图和 /metrics 的请求指标"""
+        endpoint = endpoint or UNMATCHED_ENDPOINT
+        started = g.pop('_monitor_started', None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            self.latency.record(endpoint, elapsed * 1000)
+            self.metrics.record_request(endpoint, request.method, status, elapsed)
+    
+    def _sample_status(self):
+        lag = time.time() - self.last_sample_at if self.last_sample_at else None
+        return lag, 0
+    
+    def render_metrics(self):
+        """OpenMetrics 文本格式的全部指标"""
+        return self.metrics.render()
     
     def get_current_latency(self):
-        if len(self.request_times) > 10:
-            return 50 + (len(self.request_times) % 20)
-        return 50
+        """最近一分钟所有请求延迟的中位数（毫秒），没有请求时为 0"""
+        return self.latency.histogram(window=60).percentile(0.5) or 0.0
+    
+    def get_latency_report(self):
+        """整体与各端点在 1、5、15 分钟窗口内的 p50 / p90 / p99 / max"""
+        return self.latency.report()
     
     def get_current_throughput(self):
-        cutoff_time = time.time() - 60
-        recent_requests = [t for t in self.request_times if t > cutoff_time]
-        return len(recent_requests)
+        return self.requests.count(60)
+    
+    def get_throughput_windows(self):
+        """最近 1、5、15 分钟的请求数"""
+        return {window_label(window): count for window, count in self.requests.counts().items()}
     
     def get_active_connections(self):
-        return self.active_connections
+        return self.in_flight.total
+    
+    def get_in_flight(self):
+        """当前并发数与本统计周期内的最高值，含按端点的明细"""
+        return self.in_flight.snapshot()
     
     def _save_stats_to_db(self):
         with self.lock:
             stats = NetworkStats(
                 latency=self.get_current_latency(),
                 throughput=self.get_current_throughput(),
-                active_connections=self.active_connections
+                active_connections=self.in_flight.total,
+                peak_connections=self.in_flight.reset_peaks()
             )
             
             try:
@@ -50,13 +89,20 @@ class NetworkMonitor:
             except Exception as e:
                 print(f"保存网络统计失败: {e}")
                 db.session.rollback()
+        
+        try:
+            self.history.maintain(raw_connection(), db.session.commit)
+        except Exception as e:
+            print(f"汇总网络统计失败: {e}")
+            db.session.rollback()
     
     def start_background_task(self):
         def stats_collector():
             while True:
-                time.sleep(60)
+                time.sleep(self.sample_interval)
                 with self.app.app_context():
                     self._save_stats_to_db()
+                self.last_sample_at = time.time()
         
         thread = threading.Thread(target=stats_collector)
         thread.daemon = True
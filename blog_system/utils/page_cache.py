@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, session, make_response
+
+from utils.conditional import apply_validators
+
+
+def article_tag(article_id):
+    """包含某篇文章的页面（详情页及列表页）"""
+    return 'article:%s' % int(article_id)
+
+
+def detail_tag(article_id):
+    """只指某篇文章的详情页，阅读数落库后用它单独失效"""
+    return 'detail:%s' % int(article_id)
+
+
+LIST_TAG = 'list'
+
+
+def page_cache_key():
+    """当前请求的缓存键：路由、路径参数、查询参数以及是否登录
+
+    只有匿名、且没有待显示的 flash 消息的 GET 请求可以走缓存，其余返回 None。
+    """
+    logged_in = 'user_id' in session
+    if request.method != 'GET' or logged_in or session.get('_flashes'):
+        return None
+    return (
+        request.endpoint,
+        tuple(sorted((request.view_args or {}).items())),
+        tuple(sorted(request.args.items(multi=True))),
+        logged_in
+    )
+
+
+class CachedPage:
+    __slots__ = ('body', 'mimetype', 'tags', 'meta', 'validators', 'expires_at')
+
+    def __init__(self, body, mimetype, tags, meta, validators, expires_at):
+        self.body = body
+        self.mimetype = mimetype
+        self.tags = tags
+        self.meta = meta
+        self.validators = validators
+        self.expires_at = expires_at
+
+    def response(self):
+        response = make_response(self.body)
+        response.mimetype = self.mimetype
+        if self.validators:
+            # 缓存条目随写操作失效，渲染时算出的 ETag 在条目存活期间始终有效
+            return apply_validators(response, *self.validators)
+        return response
+
+
+class PageCache:
+    """整页响应缓存：按 LRU 限制条数，每条另有 ttl 过期
+
+    每条缓存带一组标签，写操作按标签只失效受影响的页面。
+    """
+
+    def __init__(self, max_entries=500, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.tag_index = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """命中返回 CachedPage，否则返回 None；key 为 None 表示该请求不走缓存"""
+        if key is None:
+            return None
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                self._remove(key)
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, body, tags=(), meta=None, validators=None, mimetype='text/html'):
+        """缓存一份渲染结果，原样返回 body 方便视图直接 return"""
+        if key is None or self.max_entries <= 0:
+            return body
+        data = body.encode('utf-8') if isinstance(body, str) else body
+        entry = CachedPage(data, mimetype, frozenset(tags), meta, validators, time.time() + self.ttl)
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = entry
+            for tag in entry.tags:
+                self.tag_index.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+        return body
+
+    def invalidate(self, *tags):
+        """失效带有任一标签的页面，返回失效的条数"""
+        removed = 0
+        with self.lock:
+            for tag in tags:
+                for key in list(self.tag_index.get(tag, ())):
+                    self._remove(key)
+                    removed += 1
+            self.invalidations += removed
+        return removed
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tag_index.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        for tag in entry.tags:
+            keys = self.tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tag_index[tag]
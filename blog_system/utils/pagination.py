@@ -0,0 +1,96 @@
+import base64
+import binascii
+import threading
+import time
+from datetime import datetime
+
+
+def encode_cursor(created_at, item_id):
+    """把 (created_at, id) 编码成 URL 安全的翻页令牌"""
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat(' ')
+    raw = f'{created_at}|{item_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """解析翻页令牌，返回 (created_at 字符串, id)；令牌非法时返回 None"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8')
+        created_at, item_id = raw.rsplit('|', 1)
+        return created_at, int(item_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class KeysetPage:
+    """基于游标的一页结果，只提供上一页/下一页，不做 OFFSET 和精确计数"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        # 近似总数，来自 ApproximateCounter，可能为 None
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def build_keyset_page(rows, per_page, key_func, before=False, has_cursor=False):
+    """把多取一条的查询结果整理成 KeysetPage
+
+    rows 按翻页方向排序：向后翻（含首页）为倒序，向前翻（before）为正序。
+    key_func(item) 返回 (created_at, id)。
+    """
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    if before:
+        items.reverse()
+
+    if not items:
+        return KeysetPage(items)
+
+    first = encode_cursor(*key_func(items[0]))
+    last = encode_cursor(*key_func(items[-1]))
+    if before:
+        return KeysetPage(items, next_cursor=last, prev_cursor=first if has_more else None)
+    return KeysetPage(items, next_cursor=last if has_more else None,
+                      prev_cursor=first if has_cursor else None)
+
+
+class ApproximateCounter:
+    """列表总数的进程内缓存：每个 key 在 ttl 秒内只真正 COUNT 一次"""
+
+    def __init__(self, ttl=300, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, count_func):
+        now = time.time()
+        with self.lock:
+            cached = self.counts.get(key)
+            if cached and cached[1] > now:
+                return cached[0]
+
+        value = count_func()
+
+        with self.lock:
+            if len(self.counts) >= self.max_entries:
+                self.counts = {k: v for k, v in self.counts.items() if v[1] > now}
+                if len(self.counts) >= self.max_entries:
+                    self.counts.clear()
+            self.counts[key] = (value, now + self.ttl)
+        return value
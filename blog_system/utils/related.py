@@ -0,0 +1,191 @@
+import queue
+import re
+import threading
+
+from utils.search_engine import tokenize
+
+RELATED_TABLE = 'related_articles'
+
+# 打分权重：共同标签、同分类、全文相似度（按召回名次线性衰减）
+TAG_WEIGHT = 3.0
+CATEGORY_WEIGHT = 2.0
+TEXT_WEIGHT = 2.0
+
+# 每种方式最多召回的候选数
+CANDIDATE_LIMIT = 30
+
+# 全文相似度查询最多取正文开头的词数
+CONTENT_TERMS = 30
+
+
+def _tag_set(tags):
+    return {tag.strip().lower() for tag in (tags or '').replace('，', ',').split(',') if tag.strip()}
+
+
+def _leading_terms(text, limit=CONTENT_TERMS):
+    """正文开头不重复的前 limit 个词（CJK 为二元词），用来构造相似度查询
+
+    单字和标点跳过：单字在查询里是前缀匹配，召回面太宽。
+    """
+    terms = []
+    seen = set()
+    for term in re.findall(r'\w{2,}', tokenize(text)):
+        key = term.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        terms.append(term)
+        if len(terms) >= limit:
+            break
+    return terms
+
+
+class RelatedEntry:
+    __slots__ = ('id', 'title')
+
+    def __init__(self, id, title):
+        self.id = id
+        self.title = title
+
+
+class RelatedArticles:
+    """相关文章查找表：按共同标签、分类和标题、标签、正文开头的全文相似度打分，结果预先算好存库"""
+
+    def __init__(self, article_table, search_index=None, limit=5):
+        self.article_table = article_table
+        self.search_index = search_index
+        self.limit = limit
+
+    @staticmethod
+    def create_table(conn):
+        conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {RELATED_TABLE} (
+            article_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            related_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (article_id, rank)
+        ) WITHOUT ROWID
+        ''')
+
+    def lookup(self, conn, article_id):
+        """读取预计算结果，只返回仍然公开的文章"""
+        rows = conn.execute(f'''
+        SELECT r.related_id, a.title FROM {RELATED_TABLE} r
+        JOIN "{self.article_table}" a ON a.id = r.related_id
+        WHERE r.article_id = ? AND a.is_private = 0
+        ORDER BY r.rank
+        ''', (article_id,)).fetchall()
+        return [RelatedEntry(row[0], row[1]) for row in rows]
+
+    def compute(self, conn, article_id):
+        """为一篇文章打分，返回 [(related_id, score)]，按分数倒序"""
+        article = conn.execute(f'''
+        SELECT id, title, category, tags, excerpt FROM "{self.article_table}" WHERE id = ?
+        ''', (article_id,)).fetchone()
+        if article is None:
+            return []
+
+        _, title, category, tags, excerpt = article
+        text_scores = {}
+        if self.search_index is not None and self.search_index.is_ready(conn):
+            # 正文只取列表页已有的摘要，不必读取整篇正文
+            text = ' '.join([title or '', (tags or '').replace(',', ' ')] + _leading_terms(excerpt))
+            hits = [hit for hit in self.search_index.similar(conn, text, CANDIDATE_LIMIT + 1) if hit != article_id]
+            for position, hit in enumerate(hits):
+                text_scores[hit] = TEXT_WEIGHT * (1 - position / len(hits))
+
+        candidate_ids = set(text_scores)
+        if category:
+            rows = conn.execute(f'''
+            SELECT id FROM "{self.article_table}"
+            WHERE category = ? AND is_private = 0 AND id != ?
+            ORDER BY id DESC LIMIT ?
+            ''', (category, article_id, CANDIDATE_LIMIT)).fetchall()
+            candidate_ids.update(row[0] for row in rows)
+        if not candidate_ids:
+            return []
+
+        placeholders = ','.join('?' * len(candidate_ids))
+        candidates = conn.execute(f'''
+        SELECT id, category, tags FROM "{self.article_table}"
+        WHERE id IN ({placeholders}) AND is_private = 0
+        ''', list(candidate_ids)).fetchall()
+
+        own_tags = _tag_set(tags)
+        scored = []
+        for candidate_id, candidate_category, candidate_tags in candidates:
+            score = TAG_WEIGHT * len(own_tags & _tag_set(candidate_tags))
+            if category and candidate_category == category:
+                score += CATEGORY_WEIGHT
+            score += text_scores.get(candidate_id, 0)
+            if score > 0:
+                scored.append((candidate_id, score))
+
+        scored.sort(key=lambda item: (-item[1], -item[0]))
+        return scored[:self.limit]
+
+    def refresh(self, conn, article_id):
+        """重新计算并写入一篇文章的相关文章，返回相关文章 id 列表"""
+        related = self.compute(conn, article_id)
+        conn.execute(f'DELETE FROM {RELATED_TABLE} WHERE article_id = ?', (article_id,))
+        conn.executemany(f'''
+        INSERT INTO {RELATED_TABLE} (article_id, rank, related_id, score) VALUES (?, ?, ?, ?)
+        ''', [(article_id, rank, related_id, score) for rank, (related_id, score) in enumerate(related)])
+        return [related_id for related_id, _ in related]
+
+    def missing_ids(self, conn):
+        """还没有预计算结果的公开文章"""
+        rows = conn.execute(f'''
+        SELECT id FROM "{self.article_table}" a
+        WHERE is_private = 0 AND NOT EXISTS (SELECT 1 FROM {RELATED_TABLE} r WHERE r.article_id = a.id)
+        ''').fetchall()
+        return [row[0] for row in rows]
+
+
+class RelatedRefresher:
+    """后台线程按队列重算相关文章，同一篇文章在队列里只排一次"""
+
+    def __init__(self, refresh_func):
+        # refresh_func(article_id) 在调用方自己的连接和事务里完成重算，返回相关文章 id 列表
+        self.refresh_func = refresh_func
+        self.queue = queue.Queue()
+        self.queued = set()
+        self.lock = threading.Lock()
+        self._thread = None
+
+    def schedule(self, article_id, cascade=True):
+        """cascade 为 True 时，重算完再把它的相关文章也排进队列，让关系保持双向"""
+        with self.lock:
+            if article_id in self.queued:
+                return
+            self.queued.add(article_id)
+        self.queue.put((article_id, cascade))
+        if self._thread is None:
+            self.start_background_task()
+
+    def status(self):
+        """(None, 排队等待重算的文章数)"""
+        return None, self.queue.qsize()
+
+    def start_background_task(self):
+        with self.lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._worker)
+            self._thread.daemon = True
+        self._thread.start()
+
+    def _worker(self):
+        while True:
+            article_id, cascade = self.queue.get()
+            with self.lock:
+                self.queued.discard(article_id)
+            try:
+                related_ids = self.refresh_func(article_id)
+            except Exception as e:
+                print(f"计算相关文章失败: {e}")
+                continue
+            if cascade:
+                for related_id in related_ids:
+                    self.schedule(related_id, cascade=False)
@@ -0,0 +1,227 @@
+import re
+import sqlite3
+
+from markupsafe import Markup, escape
+
+# 中日韩统一表意文字（含扩展 A 与兼容区）
+CJK_RUN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+
+# bm25 列权重，顺序与建表时的列一致：title, summary, tags, content
+COLUMN_WEIGHTS = (10.0, 4.0, 6.0, 1.0)
+
+REBUILD_BATCH_SIZE = 500
+
+
+def _split_segments(text):
+    """把文本切成 (是否 CJK, 片段) 序列"""
+    pos = 0
+    for match in CJK_RUN.finditer(text):
+        if match.start() > pos:
+            yield False, text[pos:match.start()]
+        yield True, match.group()
+        pos = match.end()
+    if pos < len(text):
+        yield False, text[pos:]
+
+
+def _cjk_tokens(run):
+    # 相邻二元切分，末字单独成词，这样任意单字都能以前缀命中某个词
+    return [run[i:i + 2] for i in range(len(run) - 1)] + [run[-1]]
+
+
+def tokenize(text):
+    """写入 FTS 前的预处理：CJK 连续片段转成二元词，其余交给 unicode61 分词"""
+    if not text:
+        return ''
+
+    parts = []
+    for is_cjk, segment in _split_segments(text):
+        if is_cjk:
+            parts.extend(_cjk_tokens(segment))
+        else:
+            parts.append(segment)
+    return ' '.join(parts)
+
+
+def build_match_query(keyword, operator='AND'):
+    """把用户输入转成 FTS5 MATCH 表达式，各片段之间默认为 AND 关系"""
+    clauses = []
+    for term in keyword.split():
+        for is_cjk, segment in _split_segments(term):
+            if is_cjk and len(segment) == 1:
+                # 单字只能以前缀去匹配二元词
+                clauses.append('"%s"*' % segment)
+            elif is_cjk:
+                # 查询端只取二元词，短语匹配保证它们在原文中相邻
+                bigrams = [segment[i:i + 2] for i in range(len(segment) - 1)]
+                clauses.append('"%s"' % ' '.join(bigrams))
+            else:
+                words = re.findall(r'\w+', segment)
+                if words:
+                    clauses.append('"%s"' % ' '.join(words))
+
+    return f' {operator} '.join(clauses)
+
+
+def highlight(text, keyword, width=150):
+    """在原文中截取命中关键词附近的一段并用 <mark> 标出，返回可直接输出的 Markup"""
+    text = text or ''
+    terms = [re.escape(term) for term in keyword.split() if term]
+    if not terms:
+        return escape(text[:width])
+
+    pattern = re.compile('|'.join(sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(text)
+    start = max(0, first.start() - width // 3) if first else 0
+    window = text[start:start + width]
+
+    pieces = []
+    pos = 0
+    for match in pattern.finditer(window):
+        pieces.append(escape(window[pos:match.start()]))
+        pieces.append(Markup('<mark>%s</mark>') % match.group())
+        pos = match.end()
+    pieces.append(escape(window[pos:]))
+
+    prefix = '…' if start > 0 else ''
+    return Markup(prefix) + Markup('').join(pieces)
+
+
+def snippet_fragments(conn, article_table, article_ids, keyword, width=150):
+    """生成搜索结果摘要，返回 {文章 id: 高亮片段}
+
+    只让数据库截取第一个关键词附近的一段正文，不把整篇正文读进内存。
+    """
+    terms = keyword.split()
+    if not terms or not article_ids:
+        return {}
+
+    margin = width // 3
+    placeholders = ','.join('?' * len(article_ids))
+    rows = conn.execute(f'''
+    SELECT id, start, substr(content, start, ?) FROM (
+        SELECT id, content, MAX(1, instr(lower(content), lower(?)) - ?) AS start
+        FROM "{article_table}" WHERE id IN ({placeholders})
+    )
+    ''', [width * 2, terms[0], margin] + list(article_ids)).fetchall()
+
+    snippets = {}
+    for article_id, start, fragment in rows:
+        snippet = highlight(fragment, keyword, width)
+        if start > 1 and not snippet.startswith('…'):
+            snippet = Markup('…') + snippet
+        snippets[article_id] = snippet
+    return snippets
+
+
+class SearchIndex:
+    """基于 SQLite FTS5 的文章全文索引
+
+    所有方法都接收 DB-API 的 sqlite3 连接，由调用方控制事务，
+    这样索引更新可以和文章写入在同一个事务里提交。
+    """
+
+    def __init__(self, source_table, fts_table):
+        self.source_table = source_table
+        self.fts_table = fts_table
+        self.enabled = None
+
+    @staticmethod
+    def is_supported(conn):
+        if not isinstance(conn, sqlite3.Connection):
+            return False
+        try:
+            conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)')
+            conn.execute('DROP TABLE temp.fts5_probe')
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    def is_ready(self, conn):
+        """FTS 表是否已建立；结果缓存在进程内，未建立时调用方应退回普通查询"""
+        if self.enabled is None:
+            self.enabled = isinstance(conn, sqlite3.Connection) and conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.fts_table,)
+            ).fetchone() is not None
+        return self.enabled
+
+    def ensure_schema(self, conn):
+        """建立 FTS 表；索引条数与文章数不一致时整体重建"""
+        conn.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table}
+        USING fts5(title, summary, tags, content, tokenize = 'unicode61 remove_diacritics 2')
+        ''')
+        self.enabled = True
+        indexed = conn.execute(f'SELECT COUNT(*) FROM {self.fts_table}').fetchone()[0]
+        total = conn.execute(f'SELECT COUNT(*) FROM {self.source_table}').fetchone()[0]
+        if indexed != total:
+            return self.rebuild(conn)
+        return 0
+
+    def index_article(self, conn, article_id, title, summary, tags, content):
+        """新增或更新一篇文章的索引"""
+        conn.execute(f'DELETE FROM {self.fts_table} WHERE rowid = ?', (article_id,))
+        conn.execute(f'''
+        INSERT INTO {self.fts_table} (rowid, title, summary, tags, content)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (article_id, tokenize(title), tokenize(summary), tokenize(tags), tokenize(content)))
+
+    def remove_article(self, conn, article_id):
+        conn.execute(f'DELETE FROM {self.fts_table} WHERE rowid = ?', (article_id,))
+
+    def rebuild(self, conn):
+        """按文章表重建整个索引，返回索引的文章数"""
+        conn.execute(f'DELETE FROM {self.fts_table}')
+        count = 0
+        last_id = 0
+        while True:
+            rows = conn.execute(f'''
+            SELECT id, title, summary, tags, content FROM {self.source_table}
+            WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, REBUILD_BATCH_SIZE)).fetchall()
+            if not rows:
+                return count
+            for row in rows:
+                self.index_article(conn, *row)
+            count += len(rows)
+            last_id = rows[-1][0]
+
+    def similar(self, conn, text, limit=30):
+        """按 text 中任一词语召回相关文章，返回按相关度排序的文章 id 列表"""
+        match = build_match_query(text, operator='OR')
+        if not match:
+            return []
+
+        weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+        rows = conn.execute(f'''
+        SELECT rowid FROM {self.fts_table}
+        WHERE {self.fts_table} MATCH ?
+        ORDER BY bm25({self.fts_table}, {weights})
+        LIMIT ?
+        ''', (match, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def search(self, conn, keyword, category=None, limit=10, offset=0):
+        """按 bm25 相关度返回 (文章 id 列表, 命中总数)，只包含公开文章"""
+        match = build_match_query(keyword)
+        if not match:
+            return [], 0
+
+        where = f'{self.fts_table} MATCH ? AND a.is_private = 0'
+        params = [match]
+        if category:
+            where += ' AND a.category = ?'
+            params.append(category)
+
+        from_clause = f'{self.fts_table} JOIN {self.source_table} a ON a.id = {self.fts_table}.rowid'
+        total = conn.execute(f'SELECT COUNT(*) FROM {from_clause} WHERE {where}', params).fetchone()[0]
+
+        weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+        rows = conn.execute(f'''
+        SELECT a.id FROM {from_clause}
+        WHERE {where}
+        ORDER BY bm25({self.fts_table}, {weights}), a.id DESC
+        LIMIT ? OFFSET ?
+        ''', params + [limit, offset]).fetchall()
+
+        return [row[0] for row in rows], total
@@ -0,0 +1,107 @@
+import itertools
+import threading
+import time
+
+# 默认统计 1 分钟、5 分钟、15 分钟三个窗口
+DEFAULT_WINDOWS = (60, 300, 900)
+
+
+def window_label(window):
+    """窗口秒数对应的显示名，如 300 -> '5m'"""
+    return f'{window // 60}m' if window % 60 == 0 else f'{window}s'
+
+
+class _Stripe:
+    """一个分片：独立的锁、按秒的环形桶，以及每个窗口的滚动总数"""
+
+    __slots__ = ('lock', 'counts', 'seconds', 'totals', 'current')
+
+    def __init__(self, size, window_count):
+        self.lock = threading.Lock()
+        self.counts = [0] * size
+        # 每个桶当前对应的秒，用来识别已经过期的桶
+        self.seconds = [-1] * size
+        self.totals = [0] * window_count
+        self.current = -1
+
+
+class SlidingWindowCounter:
+    """按秒分桶的环形计数器：记录一次和查询一个窗口的总数都是 O(1)
+
+    每个窗口维护一个滚动总数，时间推进一秒时减去滑出窗口的那个桶，查询时不需要扫描。
+    计数按线程分到若干分片，各分片有自己的锁，并发请求之间很少争用同一把锁。
+    """
+
+    def __init__(self, windows=DEFAULT_WINDOWS, stripes=4):
+        self.windows = tuple(sorted(windows))
+        self.size = self.windows[-1]
+        self.stripes = [_Stripe(self.size, len(self.windows)) for _ in range(stripes)]
+        # 线程第一次记录时轮流分到一个分片；线程 id 是对齐的地址，直接取模会全部落在同一个分片
+        self._next_stripe = itertools.count()
+        self._local = threading.local()
+
+    def _advance(self, stripe, second):
+        """把分片推进到 second，滑出各窗口的桶从对应总数中减掉"""
+        if second <= stripe.current:
+            return
+        if second - stripe.current >= self.size:
+            # 空闲超过最大窗口，所有桶都已过期
+            stripe.counts = [0] * self.size
+            stripe.seconds = [-1] * self.size
+            stripe.totals = [0] * len(self.windows)
+            stripe.seconds[second % self.size] = second
+        else:
+            for s in range(stripe.current + 1, second + 1):
+                for i, window in enumerate(self.windows):
+                    expired = s - window
+                    index = expired % self.size
+                    if stripe.seconds[index] == expired:
+                        stripe.totals[i] -= stripe.counts[index]
+                index = s % self.size
+                stripe.counts[index] = 0
+                stripe.seconds[index] = s
+        stripe.current = second
+
+    def _stripe(self):
+        stripe = getattr(self._local, 'stripe', None)
+        if stripe is None:
+            stripe = self._local.stripe = self.stripes[next(self._next_stripe) % len(self.stripes)]
+        return stripe
+
+    def record(self, n=1):
+        stripe = self._stripe()
+        second = int(time.time())
+        with stripe.lock:
+            self._advance(stripe, second)
+            # 系统时间回拨时计入当前桶
+            index = stripe.current % self.size
+            stripe.counts[index] += n
+            totals = stripe.totals
+            for i in range(len(totals)):
+                totals[i] += n
+
+    def count(self, window=60):
+        """最近 window 秒内的计数，window 必须是构造时给出的窗口之一"""
+        i = self.windows.index(window)
+        second = int(time.time())
+        total = 0
+        for stripe in self.stripes:
+            with stripe.lock:
+                self._advance(stripe, second)
+                total += stripe.totals[i]
+        return total
+
+    def counts(self):
+        """所有窗口的计数，键为窗口秒数"""
+        second = int(time.time())
+        totals = [0] * len(self.windows)
+        for stripe in self.stripes:
+            with stripe.lock:
+                self._advance(stripe, second)
+                for i, value in enumerate(stripe.totals):
+                    totals[i] += value
+        return dict(zip(self.windows, totals))
+
+    def rates(self):
+        """各窗口内的平均每秒请求数"""
+        return {window: round(count / window, 3) for window, count in self.counts().items()}
@@ -0,0 +1,224 @@
+import math
+import time
+from datetime import datetime, timezone
+
+ROLLUP_TABLE = 'network_stats_rollup'
+
+# 参与汇总的采样列
+METRICS = ('latency', 'throughput', 'active_connections', 'peak_connections')
+
+# 汇总粒度（秒）及显示名
+RESOLUTIONS = (60, 3600, 86400)
+RESOLUTION_NAMES = {'raw': 'raw', 60: '1m', 3600: '1h', 86400: '1d'}
+
+STAT_COLUMNS = ('count', 'min', 'max', 'avg', 'p50', 'p90', 'p99')
+
+# 清理时每批删除的行数（汇总表按桶数），每批单独提交
+PRUNE_BATCH_SIZE = 1000
+
+# 每次最多补算的桶数，停机很久后重启时分多次追上
+ROLLUP_MAX_BUCKETS = 500
+
+# 原始采样至少保留的秒数：日汇总的分位数直接从原始采样计算
+MIN_RAW_RETENTION = 2 * 86400
+
+
+def create_rollup_table(conn):
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+        resolution INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        metric TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        min REAL,
+        max REAL,
+        avg REAL,
+        p50 REAL,
+        p90 REAL,
+        p99 REAL,
+        PRIMARY KEY (resolution, bucket, metric)
+    ) WITHOUT ROWID
+    ''')
+
+
+def _utc_text(timestamp):
+    """与 network_stats.timestamp 可比较的 UTC 时间字符串"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def summarize(values):
+    """一组采样值的 (count, min, max, avg, p50, p90, p99)，分位数取最近秩；没有值时返回 None"""
+    if not values:
+        return None
+    values = sorted(values)
+    count = len(values)
+
+    def percentile(q):
+        return values[max(1, math.ceil(q * count)) - 1]
+
+    return (count, values[0], values[-1], round(sum(values) / count, 3),
+            percentile(0.5), percentile(0.9), percentile(0.99))
+
+
+class NetworkHistory:
+    """网络统计的时间序列：原始采样加 1 分钟、1 小时、1 天三级汇总
+
+    每个桶结束后从原始采样算出 min / max / avg / 分位数写入汇总表，各级数据按保留期分批清理。
+    按时间范围查询时自动选择点数不超过 max_points 且数据仍在保留期内的最细粒度。
+    """
+
+    def __init__(self, raw_table='network_stats', sample_interval=10, retention_days=None,
+                 max_points=500, prune_interval=3600):
+        self.raw_table = raw_table
+        self.sample_interval = sample_interval
+        days = {'raw': 2, 60: 14, 3600: 180, 86400: 730}
+        days.update(retention_days or {})
+        # 保留秒数，键为 'raw' 或汇总粒度
+        self.retention = {key: value * 86400 for key, value in days.items()}
+        self.retention['raw'] = max(self.retention['raw'], MIN_RAW_RETENTION)
+        self.max_points = max_points
+        self.prune_interval = prune_interval
+        # 粒度 -> 已汇总到的时间点（不含），启动后第一次汇总时从库里恢复
+        self.rolled_until = {}
+        self.pruned_at = 0
+
+    def _load_samples(self, conn, start, end):
+        columns = ', '.join(METRICS)
+        return conn.execute(f'''
+        SELECT CAST(strftime('%s', timestamp) AS INTEGER), {columns} FROM "{self.raw_table}"
+        WHERE timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp
+        ''', (_utc_text(start), _utc_text(end))).fetchall()
+
+    def _initial_start(self, conn, resolution):
+        row = conn.execute(f'SELECT MAX(bucket) FROM {ROLLUP_TABLE} WHERE resolution = ?',
+                           (resolution,)).fetchone()
+        if row[0] is not None:
+            return row[0] + resolution
+        row = conn.execute(f'''
+        SELECT CAST(strftime('%s', MIN(timestamp)) AS INTEGER) FROM "{self.raw_table}"
+        ''').fetchone()
+        if row[0] is None:
+            return None
+        return row[0] // resolution * resolution
+
+    def rollup(self, conn, now=None):
+        """把已经结束、尚未汇总的桶写入汇总表，返回写入的行数"""
+        now = time.time() if now is None else now
+        written = 0
+        for resolution in RESOLUTIONS:
+            closed = int(now // resolution * resolution)
+            start = self.rolled_until.get(resolution)
+            if start is None:
+                start = self._initial_start(conn, resolution)
+                if start is None:
+                    # 还没有任何采样
+                    continue
+            # 已过保留期的桶算出来也会被清理掉，直接跳过
+            start = max(start, int((now - self.retention[resolution]) // resolution * resolution))
+            end = min(closed, start + resolution * ROLLUP_MAX_BUCKETS)
+            if start >= end:
+                self.rolled_until[resolution] = start
+                continue
+
+            buckets = {}
+            for row in self._load_samples(conn, start, end):
+                buckets.setdefault(row[0] // resolution * resolution, []).append(row[1:])
+            rows = []
+            for bucket, samples in buckets.items():
+                for i, metric in enumerate(METRICS):
+                    stats = summarize([sample[i] for sample in samples if sample[i] is not None])
+                    if stats is not None:
+                        rows.append((resolution, bucket, metric) + stats)
+            conn.executemany(f'''
+            INSERT OR REPLACE INTO {ROLLUP_TABLE} (resolution, bucket, metric, {', '.join(STAT_COLUMNS)})
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self.rolled_until[resolution] = end
+            written += len(rows)
+        return written
+
+    @staticmethod
+    def _delete_in_batches(conn, commit, sql, params):
+        deleted = 0
+        while True:
+            count = conn.execute(sql, params).rowcount
+            commit()
+            deleted += count
+            if not count:
+                return deleted
+
+    def prune(self, conn, commit, now=None):
+        """按保留期分批删除过期的原始采样和汇总，每批单独提交以免长时间占用写锁；返回删除的行数
+
+        原始采样只删到各级汇总都已处理过的时间点：升级后补算历史汇总需要多轮，期间不能先删掉原始数据。
+        """
+        now = time.time() if now is None else now
+        raw = f'"{self.raw_table}"'
+        deleted = 0
+        if all(resolution in self.rolled_until for resolution in RESOLUTIONS):
+            cutoff = min(now - self.retention['raw'], *self.rolled_until.values())
+            deleted += self._delete_in_batches(conn, commit, f'''
+            DELETE FROM {raw} WHERE id IN (
+                SELECT id FROM {raw} WHERE timestamp < ? ORDER BY timestamp LIMIT {PRUNE_BATCH_SIZE}
+            )
+            ''', (_utc_text(cutoff),))
+        for resolution in RESOLUTIONS:
+            deleted += self._delete_in_batches(conn, commit, f'''
+            DELETE FROM {ROLLUP_TABLE} WHERE resolution = ? AND bucket IN (
+                SELECT DISTINCT bucket FROM {ROLLUP_TABLE}
+                WHERE resolution = ? AND bucket < ? ORDER BY bucket LIMIT {PRUNE_BATCH_SIZE}
+            )
+            ''', (resolution, resolution, now - self.retention[resolution]))
+        return deleted
+
+    def maintain(self, conn, commit, now=None):
+        """采样后由后台线程调用：补算汇总，并每隔 prune_interval 秒清理一次过期数据"""
+        now = time.time() if now is None else now
+        self.rollup(conn, now)
+        commit()
+        if now - self.pruned_at >= self.prune_interval:
+            self.pruned_at = now
+            self.prune(conn, commit, now)
+
+    def pick_resolution(self, start, end, now=None):
+        """点数不超过 max_points、且起点仍在保留期内的最细粒度"""
+        now = time.time() if now is None else now
+        span = max(end - start, 0)
+        for resolution in ('raw',) + RESOLUTIONS:
+            step = self.sample_interval if resolution == 'raw' else resolution
+            if span / step <= self.max_points and start >= now - self.retention[resolution]:
+                return resolution
+        return RESOLUTIONS[-1]
+
+    def query(self, conn, start, end, now=None):
+        """[start, end) 范围内的数据点，每个点的各指标均为 min / max / avg / 分位数"""
+        resolution = self.pick_resolution(start, end, now)
+        points = []
+        if resolution == 'raw':
+            step = self.sample_interval
+            for row in self._load_samples(conn, start, end):
+                point = {'timestamp': _iso(row[0])}
+                for metric, value in zip(METRICS, row[1:]):
+                    stats = summarize([value] if value is not None else [])
+                    point[metric] = dict(zip(STAT_COLUMNS, stats)) if stats else None
+                points.append(point)
+        else:
+            step = resolution
+            rows = conn.execute(f'''
+            SELECT bucket, metric, {', '.join(STAT_COLUMNS)} FROM {ROLLUP_TABLE}
+            WHERE resolution = ? AND bucket >= ? AND bucket < ?
+            ORDER BY bucket
+            ''', (resolution, int(start // resolution * resolution), end)).fetchall()
+            by_bucket = {}
+            for row in rows:
+                point = by_bucket.get(row[0])
+                if point is None:
+                    point = by_bucket[row[0]] = {'timestamp': _iso(row[0])}
+                    points.append(point)
+                point[row[1]] = dict(zip(STAT_COLUMNS, row[2:]))
+        return {'resolution': RESOLUTION_NAMES[resolution], 'step': step, 'points': points}
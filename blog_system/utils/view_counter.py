@@ -0,0 +1,100 @@
+import atexit
+import threading
+import time
+
+
+class ViewCounter:
+    """阅读数写缓冲：请求里只在内存中累加，后台线程定期合并成一次批量写入"""
+
+    def __init__(self, flush_func, interval=5):
+        # flush_func(batch, commit)：写入后把事务的提交函数交给 commit(提交函数) 执行
+        self.flush_func = flush_func
+        self.interval = interval
+        self.pending = {}
+        self.flushing = {}
+        # 每取出一个批次加一，提交后只清空同一批次的 flushing
+        self.generation = 0
+        self.last_flush_time = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def record(self, article_id, count=1):
+        with self.lock:
+            self.pending[article_id] = self.pending.get(article_id, 0) + count
+        if self._thread is None:
+            self.start_background_task()
+
+    def get_pending(self, article_id):
+        """尚未落库的阅读数（含正在写入的批次）"""
+        with self.lock:
+            return self.pending.get(article_id, 0) + self.flushing.get(article_id, 0)
+
+    def total(self, article):
+        """页面展示用的阅读数 = 库中的值 + 缓冲中的增量"""
+        return (article.view_count or 0) + self.get_pending(article.id)
+
+    def flush(self):
+        """把缓冲的增量一次性写入数据库，返回写入的阅读次数"""
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    self.last_flush_time = time.time()
+                    return 0
+                batch, self.pending = self.pending, {}
+                self.flushing = batch
+                self.generation += 1
+                generation = self.generation
+
+            committed = []
+
+            def commit(commit_func):
+                # 提交在锁外进行，不让请求里的 record / get_pending 等磁盘写入；
+                # 提交一返回就清空 flushing，已落库的阅读数和这批增量只会在这一瞬间重叠
+                commit_func()
+                committed.append(True)
+                with self.lock:
+                    if self.generation == generation:
+                        self.flushing = {}
+                    self.last_flush_time = time.time()
+
+            try:
+                self.flush_func(batch, commit)
+            except Exception as e:
+                print(f"写入阅读数失败: {e}")
+                if committed:
+                    return sum(batch.values())
+                # 写失败时把增量并回缓冲，等下一轮重试
+                with self.lock:
+                    for article_id, count in batch.items():
+                        self.pending[article_id] = self.pending.get(article_id, 0) + count
+                    if self.generation == generation:
+                        self.flushing = {}
+                return 0
+            return sum(batch.values())
+
+    def status(self):
+        """(距上次写入的秒数或 None, 尚未落库的阅读次数)"""
+        with self.lock:
+            pending = sum(self.pending.values()) + sum(self.flushing.values())
+            last_flush_time = self.last_flush_time
+        return (time.time() - last_flush_time if last_flush_time else None), pending
+
+    def stop(self):
+        self._stop_event.set()
+        self.flush()
+
+    def start_background_task(self):
+        with self.lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._flush_loop)
+            self._thread.daemon = True
+
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.interval):
+            self.flush()